@@ -0,0 +1,197 @@
+# Copyright 2008 Seth Galbraith
+#
+# This file is part of Minimam.
+#
+# Minimam is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Minimam is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Minimam.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+How fast combat.fight.Fight draws, measured without a display.
+
+SDL's dummy video driver is used (unless SDL_VIDEODRIVER is set), so
+the benchmark runs on a build box with no screen. For every screen size
+in game.RESOLUTIONS, number of entities in COUNTS and kind of frames in
+KINDS, a still fight scene is drawn many times and these are measured:
+
+  frames_per_second  frames drawn each second by Fight.draw
+  draw_ms            Fight.draw, updating only the parts which changed
+  redraw_ms          Fight.draw, redrawing the whole screen
+  entities_ms        Fight.drawEntities
+  entity_us          Entity.draw, for one entity
+
+Times are the fastest of several runs (see benchmark.results.getTime).
+The "alpha" frames are the ones the game uses; the "colorkey" frames
+are the same pictures made opaque with a transparent color key, for
+comparison.
+
+Run it from the src directory: python -m benchmark.render --help
+'''
+
+import optparse
+import os
+import sys
+
+from game import RESOLUTIONS
+import results
+
+COUNTS = 4, 16, 64, 250, 500
+KINDS = "alpha", "colorkey"
+KEY = 255, 0, 255 # color key of the opaque frames
+WARMUP = 5 # frames drawn before measuring
+
+def createParties(count):
+  '''Make PCs and NPCs, count characters in all, of a mix of classes.'''
+  from character.warrior import Warrior
+  from character.rogue   import Rogue
+  from character.wizard  import Wizard
+  from character.priest  import Priest
+  from character.monster import Monster
+  from character.dragon  import Dragon
+  PC_classes = Warrior, Rogue, Wizard, Priest
+  NPC_classes = Monster, Dragon, Rogue
+  PCs = [PC_classes[i % len(PC_classes)]() for i in range(count // 2)]
+  NPCs = [NPC_classes[i % len(NPC_classes)]()
+          for i in range(count - count // 2)]
+  return PCs, NPCs
+
+def makeOpaque(animation):
+  '''A copy of an Animation with color keyed frames instead of alpha.'''
+  import pygame
+  from combat.animation import Animation, DIRECTIONS, STATES
+  opaque = Animation()
+  copies = {}
+  for direction in DIRECTIONS:
+    for state in STATES:
+      frame = animation.frames[direction][state]
+      if frame is None: continue
+      if frame not in copies:
+        surface = pygame.Surface(frame.get_size()).convert()
+        surface.fill(KEY)
+        surface.blit(frame, (0, 0))
+        surface.set_colorkey(KEY, pygame.RLEACCEL)
+        copies[frame] = surface
+      opaque.frames[direction][state] = copies[frame]
+  opaque.masks = animation.masks
+  return opaque
+
+def getCase(resolution, count, kind):
+  '''The name of a case in the results, such as "1280x800 64 alpha".'''
+  return "%dx%d %d %s" % (resolution[0], resolution[1], count, kind)
+
+def measure(resolution, count, kind, samples):
+  '''Draw one scene repeatedly. Returns a dictionary of measurements.'''
+  import pygame
+  from combat.fight import Fight
+  pygame.display.set_mode(resolution)
+  PCs, NPCs = createParties(count)
+  fight = Fight(PCs, NPCs)
+  entities = fight.PCs + fight.NPCs
+  fight.entity = entities[0] # the entity whose turn it is, with no target
+  if kind == "colorkey":
+    opaque = {}
+    for entity in entities:
+      if entity.animation not in opaque:
+        opaque[entity.animation] = makeOpaque(entity.animation)
+      entity.animation = opaque[entity.animation]
+  for i in range(WARMUP): fight.draw() # the first one redraws everything
+  def redraw():
+    fight.redraw = True
+    fight.draw()
+  def drawEach():
+    for entity in entities: entity.draw()
+  draw = results.getTime(fight.draw, samples)
+  return {
+    "frames_per_second": 1.0 / draw,
+    "draw_ms": draw * 1000,
+    "redraw_ms": results.getTime(redraw, samples) * 1000,
+    "entities_ms": results.getTime(fight.drawEntities, samples) * 1000,
+    "entity_us": results.getTime(drawEach, samples) * 1e6 / count,
+  }
+
+def run(resolutions = RESOLUTIONS, counts = COUNTS, kinds = KINDS,
+        samples = 30, progress = None):
+  '''
+  Measure every combination. progress is called with each case's name
+  and measurements. Returns the results (see benchmark.results).
+  '''
+  import pygame
+  pygame.init()
+  measurements = {}
+  for resolution in resolutions:
+    for count in counts:
+      for kind in kinds:
+        case = getCase(resolution, count, kind)
+        measurements[case] = measure(resolution, count, kind, samples)
+        if progress is not None: progress(case, measurements[case])
+  pygame.quit()
+  return measurements
+
+def parseResolution(text):
+  '''Turn "1280x800" into (1280, 800).'''
+  width, height = text.lower().split("x")
+  return int(width), int(height)
+
+def main(arguments = None):
+  parser = optparse.OptionParser(
+    usage = "%prog [options]",
+    description = "Measure how fast fights are drawn, without a display. "
+                  "The results are written as JSON, or compared with the "
+                  "results of an earlier run (exiting with status 1 if "
+                  "anything got slower than the threshold).")
+  parser.add_option("-r", "--resolution", action = "append",
+                    help = "screen size such as 1280x800, may be repeated "
+                           "[every size in game.py]")
+  parser.add_option("-c", "--count", type = "int", action = "append",
+                    help = "number of entities, may be repeated "
+                           "[%s]" % ", ".join(map(str, COUNTS)))
+  parser.add_option("-k", "--kind", action = "append", choices = KINDS,
+                    help = "alpha or colorkey frames, may be repeated [both]")
+  parser.add_option("-n", "--samples", type = "int", default = 30,
+                    help = "frames drawn for each measurement [%default]")
+  parser.add_option("-o", "--output",
+                    help = "file to write the results to [standard output]")
+  parser.add_option("-b", "--baseline",
+                    help = "results of an earlier run to compare with")
+  parser.add_option("-t", "--threshold", type = "float",
+                    default = results.THRESHOLD * 100,
+                    help = "percent worse than the baseline which counts as "
+                           "a regression [%default]")
+  options, arguments = parser.parse_args(arguments)
+  os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+  resolutions = RESOLUTIONS
+  if options.resolution:
+    try:
+      resolutions = [parseResolution(text) for text in options.resolution]
+    except ValueError:
+      parser.error("screen sizes look like 1280x800")
+  def progress(case, measurements):
+    sys.stderr.write("%-22s %8.1f frames per second\n" %
+                     (case, measurements["frames_per_second"]))
+  measurements = run(resolutions, options.count or COUNTS,
+                     options.kind or KINDS, options.samples, progress)
+  if options.output:
+    stream = open(options.output, "w")
+    results.save("render", measurements, stream)
+    stream.close()
+  elif not options.baseline:
+    results.save("render", measurements, sys.stdout)
+  if options.baseline:
+    stream = open(options.baseline)
+    baseline = results.load(stream)
+    stream.close()
+    rows = results.compare(measurements, baseline,
+                           options.threshold / 100.0)
+    if results.report(rows): sys.exit(1)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,127 @@
+# Copyright 2008 Seth Galbraith
+#
+# This file is part of Minimam.
+#
+# Minimam is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Minimam is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Minimam.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Timing benchmarks, saving the results as JSON and comparing them with
+a baseline.
+
+Results are a dictionary of cases (such as "1280x800 64 alpha") each
+with a dictionary of measurements. A measurement whose name ends with
+"per_second" or "per_core" is better when it is higher; any other
+measurement is a time and better when it is lower.
+'''
+
+import itertools
+import json
+import platform
+import sys
+import timeit
+
+THRESHOLD = 0.10 # how much worse than the baseline counts as a regression
+REPEATS = 5 # runs of each measurement, of which the fastest is used
+RUN_TIME = 0.05 # shortest run in seconds
+
+timer = timeit.default_timer
+
+def getTime(function, samples, repeats = REPEATS):
+  '''
+  The seconds one call of a function takes: the calls are timed in
+  several runs and the fastest run is used, as timeit does, because
+  the slower runs were held up by something else on the computer.
+  Each run makes at least samples / repeats calls and lasts at least
+  RUN_TIME seconds.
+  '''
+  number = max(1, samples // repeats)
+  while True:
+    start = timer()
+    for j in itertools.repeat(None, number): function()
+    time = timer() - start
+    if time >= RUN_TIME: break
+    number = number * 2
+  best = time / number
+  for i in range(repeats - 1):
+    start = timer()
+    for j in itertools.repeat(None, number): function()
+    best = min(best, (timer() - start) / number)
+  return best
+
+def getEnvironment():
+  '''What the benchmark was run on, saved with the results.'''
+  environment = {
+    "python": platform.python_version(),
+    "platform": platform.platform(),
+    "machine": platform.machine(),
+  }
+  try:
+    import pygame
+    environment["pygame"] = pygame.version.ver
+  except ImportError:
+    pass
+  try:
+    import numpy
+    environment["numpy"] = numpy.__version__
+  except ImportError:
+    pass
+  return environment
+
+def save(name, results, stream):
+  '''Write the results of a benchmark to a file as JSON.'''
+  document = {"benchmark": name, "environment": getEnvironment(),
+              "results": results}
+  json.dump(document, stream, indent = 1, separators = (",", ": "),
+            sort_keys = True)
+  stream.write("\n")
+
+def load(stream):
+  '''Read the results written by save.'''
+  return json.load(stream)["results"]
+
+def isHigherBetter(measurement):
+  return measurement.endswith(("per_second", "per_core"))
+
+def compare(results, baseline, threshold = THRESHOLD):
+  '''
+  Compare results with a baseline, case by case. Returns a list of
+  (case, measurement, baseline value, new value, change, regression)
+  where change is how much worse (positive) or better (negative) the
+  new value is, as a fraction of the baseline value. Cases and
+  measurements missing from either side are left out.
+  '''
+  rows = []
+  for case in sorted(results):
+    if case not in baseline: continue
+    for measurement in sorted(results[case]):
+      if measurement not in baseline[case]: continue
+      old = baseline[case][measurement]
+      new = results[case][measurement]
+      if not old: continue
+      change = (new - old) / float(old)
+      if isHigherBetter(measurement): change = -change
+      rows.append((case, measurement, old, new, change, change > threshold))
+  return rows
+
+def report(rows, stream = sys.stdout):
+  '''Write a comparison as a table. Returns the number of regressions.'''
+  regressions = 0
+  for case, measurement, old, new, change, regression in rows:
+    if regression: regressions = regressions + 1
+    mark = ""
+    if regression: mark = "  REGRESSION"
+    stream.write("%-28s %-22s %12.3f %12.3f %+7.1f%%%s\n" %
+                 (case, measurement, old, new, change * 100, mark))
+  stream.write("%d measurements, %d regressions\n" % (len(rows), regressions))
+  return regressions
@@ -0,0 +1,244 @@
+# Copyright 2008 Seth Galbraith
+#
+# This file is part of Minimam.
+#
+# Minimam is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Minimam is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Minimam.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+How fast the rules run, measured without drawing anything.
+
+Two kinds of case are measured:
+
+  operations  op_ns: nanoseconds for one call of a rules method, such
+              as Character.roll, Character.attack or the target scans
+              of Entity, including the cost of calling it from Python
+  fights      fights_per_second and turn_ns: whole fights played by
+              combat.engine.Engine, for several party sizes and mixes
+              of levels (see LEVELS)
+
+The attacks and fights are measured separately for three paths
+through the rules: "normal" attacks which injure, the "fireball"
+attacks of Wizards and Dragons, and the "escaping" bonuses of Rogues
+(against escaping targets and while escaping themselves). The dice are
+seeded, so every run rolls the same numbers and plays the same fights.
+
+The target scans and turn order use real Entities in a Fight, so Pygame
+is needed (with SDL's dummy video driver, so no window is opened).
+
+Run it from the src directory: python -m benchmark.rules --help
+'''
+
+import functools
+import itertools
+import optparse
+import os
+import sys
+
+from character.character import INJURED, INCAPACITATED
+from character.warrior import Warrior
+from character.rogue   import Rogue
+from character.wizard  import Wizard
+from character.priest  import Priest
+from character.monster import Monster
+from character.dragon  import Dragon
+from character.dice import Dice, setDice
+from combat.engine import Engine, isDefeated
+import results
+
+SEED = 1
+SIZES = 4, 16, 64 # characters in each party
+SCAN_SIZES = 4, 16, 64, 256 # entities scanned by the target scans
+PATHS = "normal", "fireball", "escaping"
+LEVELS = {
+  "level0": (0,),
+  "mixed": (0, 1, 2, 3, 4),
+  "level4": (4,),
+}
+
+# the classes of the PCs and NPCs in the fights for each path
+PARTIES = {
+  "normal": ((Warrior, Priest), (Monster,)),
+  "fireball": ((Wizard, Priest), (Dragon, Monster)),
+  "escaping": ((Rogue,), (Rogue, Monster)),
+}
+
+CALLS = 1000 # fewest calls of each operation timed
+TURNS = 20000 # fewest turns played for each fight case
+FIGHTS = 16 # different fights played for each fight case
+
+def createParty(classes, size, levels):
+  '''size new characters of these classes and levels, taken in turn.'''
+  party = []
+  for i in range(size):
+    character = classes[i % len(classes)]()
+    character.setLevel(levels[i % len(levels)])
+    party.append(character)
+  return party
+
+def attackEscaping(attacker, target):
+  '''An attack on a target which starts escaping first.'''
+  target.startEscaping()
+  return attacker.attack(target)
+
+def getOperations():
+  '''The operations on characters, as functions by case name.'''
+  operations = {
+    "roll": Warrior().roll,
+    "takeNormalDamage": Monster().takeNormalDamage,
+    "takeFireballDamage": Monster().takeFireballDamage,
+    "attack normal": functools.partial(Warrior().attack, Monster()),
+    "attack fireball": functools.partial(Wizard().attack, Monster()),
+    "attack fireball dragon": functools.partial(Dragon().attack, Warrior()),
+    # a Rogue attacking someone escaping, and a Rogue defending while escaping
+    "attack escaping": functools.partial(attackEscaping, Rogue(), Monster()),
+    "attack escaping defender": functools.partial(attackEscaping, Monster(),
+                                                  Rogue()),
+  }
+  return operations
+
+def getScans(size):
+  '''
+  The target scans, turn order and defeat test over size entities in
+  each party, as functions by case name. Half the PCs are injured and
+  all but the last NPC are incapacitated, so every scan looks at every
+  entity and finds some targets.
+  '''
+  from combat.fight import Fight
+  PCs = createParty((Warrior, Priest, Rogue, Wizard), size, (0,))
+  NPCs = createParty((Monster, Dragon), size, (0,))
+  for character in PCs[::2]: character.health = INJURED
+  for character in NPCs[:-1]: character.health = INCAPACITATED
+  fight = Fight(PCs, NPCs)
+  entity = fight.PCs[0]
+  return {
+    "getHealingTargets %d" % size:
+      functools.partial(entity.getHealingTargets, fight.PCs),
+    "getAttackTargets %d" % size:
+      functools.partial(entity.getAttackTargets, fight.NPCs),
+    "sortedEntities %d" % size: fight.sortedEntities,
+    "isDefeated %d" % size: functools.partial(isDefeated, fight.NPCs),
+  }
+
+def measureOperation(function, calls = CALLS):
+  setDice(Dice(SEED))
+  return {"op_ns": results.getTime(function, calls) * 1e9}
+
+def measureFights(path, size, levels, turns = TURNS):
+  '''
+  Play the same FIGHTS fights over and over (with the dice seeded in
+  turn from SEED onwards), restoring the characters before each one.
+  '''
+  PC_classes, NPC_classes = PARTIES[path]
+  engine = Engine(createParty(PC_classes, size, levels),
+                  createParty(NPC_classes, size, levels))
+  seeds = itertools.cycle(range(SEED, SEED + FIGHTS))
+  played = []
+  def fight():
+    engine.restore()
+    engine.dice = Dice(next(seeds))
+    outcome, turns = engine.resolve()
+    played.append(turns)
+  for i in range(FIGHTS): fight()
+  # about the same number of turns whatever the size of the parties
+  average = sum(played) / float(len(played))
+  del played[:]
+  time = results.getTime(fight, max(FIGHTS, int(turns / average)))
+  average = sum(played) / float(len(played))
+  return {"fights_per_second": 1.0 / time, "turn_ns": time * 1e9 / average}
+
+def getFightCase(path, size, levels):
+  return "fight %s %d %s" % (path, size, levels)
+
+def run(paths = PATHS, sizes = SIZES, levels = sorted(LEVELS),
+        scan_sizes = SCAN_SIZES, progress = None):
+  '''
+  Measure the operations, target scans and fights. progress is called
+  with each case's name and measurements. Returns the results (see
+  benchmark.results).
+  '''
+  import pygame
+  pygame.init()
+  pygame.display.set_mode((640, 480))
+  measurements = {}
+  def record(case, measurement):
+    measurements[case] = measurement
+    if progress is not None: progress(case, measurement)
+  operations = getOperations()
+  for case in sorted(operations):
+    if case.startswith("attack ") and case.split()[1] not in paths: continue
+    record(case, measureOperation(operations[case]))
+  for size in scan_sizes:
+    scans = getScans(size)
+    for case in sorted(scans): record(case, measureOperation(scans[case]))
+  for path in paths:
+    for size in sizes:
+      for mix in levels:
+        record(getFightCase(path, size, mix),
+               measureFights(path, size, LEVELS[mix]))
+  pygame.quit()
+  return measurements
+
+def main(arguments = None):
+  parser = optparse.OptionParser(
+    usage = "%prog [options]",
+    description = "Measure how fast the rules run: single operations in "
+                  "nanoseconds and whole fights per second. The results "
+                  "are written as JSON, or compared with the results of an "
+                  "earlier run (exiting with status 1 if anything got "
+                  "slower than the threshold).")
+  parser.add_option("-p", "--path", action = "append", choices = PATHS,
+                    help = "normal, fireball or escaping, may be repeated "
+                           "[all]")
+  parser.add_option("-s", "--size", type = "int", action = "append",
+                    help = "characters in each party in the fights, may be "
+                           "repeated [%s]" % ", ".join(map(str, SIZES)))
+  parser.add_option("-l", "--levels", action = "append",
+                    choices = sorted(LEVELS),
+                    help = "levels of the characters in the fights: "
+                           "%s, may be repeated [all]" %
+                           ", ".join(sorted(LEVELS)))
+  parser.add_option("-o", "--output",
+                    help = "file to write the results to [standard output]")
+  parser.add_option("-b", "--baseline",
+                    help = "results of an earlier run to compare with")
+  parser.add_option("-t", "--threshold", type = "float",
+                    default = results.THRESHOLD * 100,
+                    help = "percent worse than the baseline which counts as "
+                           "a regression [%default]")
+  options, arguments = parser.parse_args(arguments)
+  os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+  def progress(case, measurements):
+    if "op_ns" in measurements:
+      sys.stderr.write("%-28s %10.0f ns\n" % (case, measurements["op_ns"]))
+    else:
+      sys.stderr.write("%-28s %10.1f fights per second\n" %
+                       (case, measurements["fights_per_second"]))
+  measurements = run(options.path or PATHS, options.size or SIZES,
+                     options.levels or sorted(LEVELS), SCAN_SIZES, progress)
+  if options.output:
+    stream = open(options.output, "w")
+    results.save("rules", measurements, stream)
+    stream.close()
+  elif not options.baseline:
+    results.save("rules", measurements, sys.stdout)
+  if options.baseline:
+    stream = open(options.baseline)
+    baseline = results.load(stream)
+    stream.close()
+    rows = results.compare(measurements, baseline,
+                           options.threshold / 100.0)
+    if results.report(rows): sys.exit(1)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,217 @@
+# Copyright 2008 Seth Galbraith
+#
+# This file is part of Minimam.
+#
+# Minimam is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Minimam is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Minimam.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+How many fights one core can host with combat.server.
+
+The server runs in a process of its own and clients connect to it over
+localhost, each playing several fights one after the other and
+choosing their PCs' actions the way combat.engine.chooseRandomAction
+would. For every number of clients connected at once in SESSIONS,
+these are measured:
+
+  fights_per_second  fights finished each second by all the clients
+  command_us         microseconds of the server's CPU time for each
+                     command (starting a fight, or a PC's action and the
+                     NPC turns after it)
+  sessions_per_core  sessions one core could host if every player
+                     takes PACE seconds to choose an action
+
+The clients run in this process, so fights_per_second also depends
+on how fast they are. The CPU time is the server's alone.
+
+Run it from the src directory: python -m benchmark.sessions --help
+'''
+
+import asynchat
+import asyncore
+import json
+import multiprocessing
+import optparse
+import os
+import socket
+import sys
+
+from character.dice import Dice
+from combat.engine import UNDECIDED
+from combat.server import FightServer, CHARACTER
+from combat import log
+import results
+
+SEED = 1
+SESSIONS = 1, 16, 256 # clients connected at once
+FIGHTS = 10 # fights played by each client
+PCS = "Priest:1,Rogue:1,Warrior:1,Wizard:1"
+NPCS = "Monster,Monster,Dragon:2,Monster,Monster"
+PACE = 2.0 # seconds a player takes to choose an action
+
+def serve(connection):
+  '''
+  Run a server in a worker process. Its address is sent over the
+  connection, and when anything is sent back the server stops and
+  sends the CPU time it used.
+  '''
+  map = {}
+  server = FightServer(port = 0, sessions = max(SESSIONS) * 4, map = map)
+  connection.send(server.getAddress())
+  start = os.times()
+  while not connection.poll():
+    asyncore.loop(0.01, True, map, 1)
+  end = os.times()
+  connection.send((end[0] - start[0]) + (end[1] - start[1]))
+  server.close()
+
+class Player(asynchat.async_chat):
+
+  '''A client playing fights with random actions.'''
+
+  def __init__(self, address, fights, seed, map):
+    asynchat.async_chat.__init__(self, map = map)
+    self.set_terminator("\n")
+    self.incoming = []
+    self.fights = fights # left to play
+    self.dice = Dice(seed)
+    self.healers = [] # which characters are healers, by number
+    self.commands = 0 # sent to the server
+    self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+    self.connect(address)
+
+  def handle_connect(self):
+    self.start()
+
+  def collect_incoming_data(self, data):
+    self.incoming.append(data)
+
+  def found_terminator(self):
+    update = json.loads("".join(self.incoming))
+    self.incoming = []
+    if "error" in update: raise ValueError(update["error"])
+    for kind, actor, target, value in update["events"]:
+      if kind == CHARACTER:
+        self.healers.append(log.CLASSES[target]().isHealer())
+    if update["outcome"] != UNDECIDED:
+      self.fights = self.fights - 1
+      if self.fights > 0: self.start()
+      else:               self.close_when_done()
+    else:
+      self.command(self.choose(update))
+
+  def command(self, message):
+    self.push(json.dumps(message) + "\n")
+    self.commands = self.commands + 1
+
+  def start(self):
+    self.healers = []
+    self.command({"command": "start", "PCs": PCS, "NPCs": NPCS,
+                  "seed": self.dice.randrange(1 << 30)})
+
+  def choose(self, update):
+    '''The command for a PC's turn, as chooseRandomAction would choose.'''
+    actor = update["turn"]
+    health, escape = update["conditions"][actor]
+    healer = self.healers[actor]
+    if health == 1: # injured
+      if healer: return {"command": "heal", "target": actor}
+      else:      return {"command": "escape"}
+    if healer and update["heal"]:
+      return {"command": "heal", "target": self.dice.choice(update["heal"])}
+    if update["attack"]:
+      return {"command": "attack",
+              "target": self.dice.choice(update["attack"])}
+    return {"command": "escape"}
+
+def measure(sessions, fights = FIGHTS):
+  '''Play fights with this many clients at once.'''
+  connection, child = multiprocessing.Pipe()
+  process = multiprocessing.Process(target = serve, args = (child,))
+  process.start()
+  try:
+    address = connection.recv()
+    map = {}
+    dice = Dice(SEED)
+    players = [Player(address, fights, dice.randrange(1 << 30), map)
+               for i in range(sessions)]
+    start = results.timer()
+    asyncore.loop(0.1, True, map)
+    elapsed = results.timer() - start
+    connection.send(None)
+    cpu = connection.recv()
+  finally:
+    process.join()
+  commands = sum([player.commands for player in players])
+  command_time = cpu / max(commands, 1)
+  return {"fights_per_second": sessions * fights / elapsed,
+          "command_us": command_time * 1e6,
+          "sessions_per_core": PACE / max(command_time, 1e-9)}
+
+def run(sessions = SESSIONS, fights = FIGHTS, progress = None):
+  '''
+  Measure each number of sessions. progress is called with each case's
+  name and measurements. Returns the results (see benchmark.results).
+  '''
+  measurements = {}
+  for count in sessions:
+    case = "sessions %d" % count
+    measurements[case] = measure(count, fights)
+    if progress is not None: progress(case, measurements[case])
+  return measurements
+
+def main(arguments = None):
+  parser = optparse.OptionParser(
+    usage = "%prog [options]",
+    description = "Measure how many fights a combat.server process hosts, "
+                  "with clients playing over localhost. The results are "
+                  "written as JSON, or compared with the results of an "
+                  "earlier run (exiting with status 1 if anything got "
+                  "worse than the threshold).")
+  parser.add_option("-s", "--sessions", type = "int", action = "append",
+                    help = "clients connected at once, may be repeated "
+                           "[%s]" % ", ".join(map(str, SESSIONS)))
+  parser.add_option("-n", "--fights", type = "int", default = FIGHTS,
+                    help = "fights played by each client [%default]")
+  parser.add_option("-o", "--output",
+                    help = "file to write the results to [standard output]")
+  parser.add_option("-b", "--baseline",
+                    help = "results of an earlier run to compare with")
+  parser.add_option("-t", "--threshold", type = "float",
+                    default = results.THRESHOLD * 100,
+                    help = "percent worse than the baseline which counts as "
+                           "a regression [%default]")
+  options, arguments = parser.parse_args(arguments)
+  def progress(case, measurements):
+    sys.stderr.write("%-14s %8.1f fights per second %8.1f us per command "
+                     "%8.0f sessions per core\n" %
+                     (case, measurements["fights_per_second"],
+                      measurements["command_us"],
+                      measurements["sessions_per_core"]))
+  measurements = run(options.sessions or SESSIONS, options.fights, progress)
+  if options.output:
+    stream = open(options.output, "w")
+    results.save("sessions", measurements, stream)
+    stream.close()
+  elif not options.baseline:
+    results.save("sessions", measurements, sys.stdout)
+  if options.baseline:
+    stream = open(options.baseline)
+    baseline = results.load(stream)
+    stream.close()
+    rows = results.compare(measurements, baseline,
+                           options.threshold / 100.0)
+    if results.report(rows): sys.exit(1)
+
+if __name__ == "__main__":
+  main()
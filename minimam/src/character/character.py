@@ -15,7 +15,7 @@
 # You should have received a copy of the GNU General Public License
 # along with Minimam.  If not, see <http://www.gnu.org/licenses/>.
 
-import random
+import dice
 
 # degrees of health
 HEALTHY = 2
@@ -27,11 +27,19 @@ STAYING = 0
 LEAVING = 1
 GONE = 2
 
-class Character:
+class Character(object):
 
   '''Abstract base class for minimam Role-Playing Game characters.'''
 
+  # Characters have no instance dictionary, only these five values,
+  # so large fights with many characters use much less memory.
+  # Subclasses must also define __slots__ (even an empty one).
+  # party is the character.party.PartyIndex told about every change
+  # of health or escape, or None.
+  __slots__ = "points", "level", "health", "escape", "party"
+
   def __init__(self, level = 0):
+    self.party = None
     self.setLevel(level)
     self.health = HEALTHY
     self.escape = STAYING
@@ -55,22 +63,35 @@ class Character:
 
   def getLevel(self):
     '''Return the character's current level.'''
-    if self.character_points < 10:    return 0
-    if self.character_points < 100:   return 1
-    if self.character_points < 1000:  return 2
-    if self.character_points < 10000: return 3
-    return 4
+    return self.level
 
   def setLevel(self, new_level):
     '''Set the character's level and give him the minimum CP for that level.'''
     self.character_points = pow(10, new_level)
 
+  def getCharacterPoints(self):
+    return self.points
+
+  def setCharacterPoints(self, character_points):
+    '''
+    Set the character's CP. His level only changes when his CP change,
+    so it is worked out here instead of every time he rolls a die.
+    '''
+    self.points = character_points
+    if   character_points < 10:    self.level = 0
+    elif character_points < 100:   self.level = 1
+    elif character_points < 1000:  self.level = 2
+    elif character_points < 10000: self.level = 3
+    else:                          self.level = 4
+
+  character_points = property(getCharacterPoints, setCharacterPoints)
+
   def roll(self):
     '''
     Simulate the value of rolling one six-sided die
     and adding the character's level.
     '''
-    return random.randrange(1,7) + self.getLevel()
+    return dice.current.roll() + self.level
 
   def attackRoll(self, other):
     return self.roll()
@@ -86,16 +107,19 @@ class Character:
     self.escape = STAYING
     if self.isHealthy(): self.health = INJURED
     else:                self.health = INCAPACITATED
+    if self.party is not None: self.party.update(self)
 
   def takeFireballDamage(self):
     '''Be incapacitated by a Wizard or Dragon's fireball.'''
     self.escape = STAYING
     self.health = INCAPACITATED
+    if self.party is not None: self.party.update(self)
 
   def heal(self):
     '''Be healed.'''
     if self.isIncapacitated(): self.health = INJURED
     else:                      self.health = HEALTHY
+    if self.party is not None: self.party.update(self)
 
   def attack(self, other):
     '''
@@ -103,23 +127,44 @@ class Character:
     Returns True if the attack is successful, False if it fails.
     '''
     if self.attackRoll(other) > other.defenseRoll(self):
-      other.takeNormalDamage()
+      self.hit(other)
       return True
     else:
       return False
+
+  def hit(self, other):
+    '''Damage another character with a successful attack.'''
+    other.takeNormalDamage()
   
+  def copy(self):
+    '''Make a new character of the same class in the same condition.'''
+    other = self.__class__.__new__(self.__class__)
+    other.points, other.level = self.points, self.level
+    other.health, other.escape = self.health, self.escape
+    other.party = None
+    return other
+
   def restore(self):
     '''Remove temporary conditions such as damage and escaping.'''
     self.health = HEALTHY
     self.escape = STAYING
+    if self.party is not None: self.party.update(self)
+
+  def setCondition(self, health, escape):
+    '''Set the character's health and stage of escape at once.'''
+    self.health = health
+    self.escape = escape
+    if self.party is not None: self.party.update(self)
 
   def startEscaping(self):
     '''Call this when the character starts to escape.'''
     self.escape = LEAVING
+    if self.party is not None: self.party.update(self)
 
   def finishEscaping(self):
     '''Call this when the character has been escaping for a full round.'''
     self.escape = GONE
+    if self.party is not None: self.party.update(self)
     
   def isEscaping(self):
     return self.escape == LEAVING
@@ -0,0 +1,97 @@
+# Copyright 2008 Seth Galbraith
+#
+# This file is part of Minimam.
+#
+# Minimam is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Minimam is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Minimam.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Where all the random numbers in the game come from.
+
+Character.roll and the choice of random actions use the current Dice
+(see getDice and setDice). A Dice made with a seed always produces the
+same rolls, so a fight can be played again exactly, and spawn gives
+independent Dice for each worker when many fights run in parallel.
+'''
+
+import binascii
+import random
+
+# How many bytes of random bits are turned into die rolls at once.
+BLOCK = 4096
+
+SEED_BITS = 128 # in the seeds of spawned Dice
+
+# Bytes 0-251 become die rolls (252 is a multiple of 6, so every face is
+# equally likely) and bytes 252-255 are thrown away.
+FACES = "".join([chr(b % 6 + 1) for b in range(252)]) + "\0" * 4
+DISCARD = "".join([chr(b) for b in range(252, 256)])
+
+class Dice(object):
+
+  '''A seedable stream of six-sided dice and other random numbers.'''
+
+  def __init__(self, seed = None):
+    self.seed = seed
+    self.generator = random.Random(seed)
+    self.buffer = bytearray()
+    self.position = 0
+
+  def refill(self):
+    '''Turn a whole block of random bits into die rolls at once.'''
+    bits = "%0*x" % (BLOCK * 2, self.generator.getrandbits(BLOCK * 8))
+    data = binascii.unhexlify(bits)
+    self.buffer = bytearray(data.translate(FACES, DISCARD))
+    self.position = 0
+
+  def roll(self):
+    '''Roll one six-sided die.'''
+    if self.position >= len(self.buffer): self.refill()
+    self.position = self.position + 1
+    return self.buffer[self.position - 1]
+
+  # Dice can be used in place of the random module for these methods.
+
+  def random(self):
+    '''A random number from 0.0 up to (but not including) 1.0.'''
+    return self.generator.random()
+
+  def randrange(self, n):
+    '''A random whole number from 0 to n - 1.'''
+    return self.generator.randrange(n)
+
+  def choice(self, items):
+    '''A random item from a non-empty sequence.'''
+    return items[self.generator.randrange(len(items))]
+
+  def spawn(self, count):
+    '''
+    Make independent Dice, one for each worker process (or for each
+    stretch of fights in a log, see combat.log).
+    Spawning from Dice with the same seed gives the same new Dice.
+    '''
+    return [Dice(self.generator.getrandbits(SEED_BITS))
+            for i in range(count)]
+
+current = Dice()
+
+def getDice():
+  '''The Dice used by Character.roll and random actions.'''
+  return current
+
+def setDice(dice):
+  '''Start using different Dice. Returns the Dice used until now.'''
+  global current
+  previous = current
+  current = dice
+  return previous
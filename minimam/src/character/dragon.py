@@ -31,18 +31,16 @@ from character import Character
 
 class Dragon(Character):
 
+  __slots__ = ()
+
   def hideRoll(self):
     return self.roll() + 1
 
   def isFirst(self):
     return True
 
-  def attack(self, other):
-    if self.attackRoll(other) > other.defenseRoll(other):
-      other.takeFireballDamage()
-      return True
-    else:
-      return False
+  def hit(self, other):
+    other.takeFireballDamage()
 
   def attackRoll(self, other):
     return self.roll() + 1
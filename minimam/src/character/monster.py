@@ -18,4 +18,4 @@
 from character import Character
 
 class Monster(Character):
-  pass
+  __slots__ = ()
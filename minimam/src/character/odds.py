@@ -0,0 +1,74 @@
+# Copyright 2008 Seth Galbraith
+#
+# This file is part of Minimam.
+#
+# Minimam is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Minimam is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Minimam.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+The chance of an attack succeeding, worked out once in advance.
+
+An attack succeeds when 1d6 + level + bonus for the attacker is greater
+than 1d6 + level + bonus for the defender, so the chance only depends on
+the difference between the two modifiers. Instead of rolling two dice,
+an attack can be decided with one random number compared to the chance.
+'''
+
+from dice import getDice
+from traits import getTraits
+
+MAX_LEVEL = 4 # see Character.getLevel
+MAX_BONUS = 1 # see the attackRoll and defenseRoll methods of each class
+
+# The largest possible difference between attack and defense modifiers.
+MAX_DIFFERENCE = MAX_LEVEL + MAX_BONUS
+
+def countHits(difference):
+  '''Count the ways (out of 36) two dice give a hit with this difference.'''
+  hits = 0
+  for attack in range(1, 7):
+    for defense in range(1, 7):
+      if attack + difference > defense: hits = hits + 1
+  return hits
+
+# HIT_CHANCES[difference + MAX_DIFFERENCE] is the chance of a hit
+# when the attacker's modifiers are greater by difference.
+HIT_CHANCES = [countHits(d) / 36.0
+               for d in range(-MAX_DIFFERENCE, MAX_DIFFERENCE + 1)]
+
+def getChance(difference):
+  '''The chance of a hit when the attacker's modifiers are greater by this.'''
+  if difference < -MAX_DIFFERENCE: return 0.0
+  if difference > MAX_DIFFERENCE:  return 1.0
+  return HIT_CHANCES[difference + MAX_DIFFERENCE]
+
+def getHitChance(attack_level, attack_bonus, defense_level, defense_bonus):
+  '''The chance that an attacker with this level and bonus hits a defender.'''
+  return getChance(attack_level + attack_bonus - defense_level - defense_bonus)
+
+def getAttackChance(attacker, defender):
+  '''The chance that one character's attack against another succeeds.'''
+  escaping = defender.isEscaping()
+  attack = getTraits(attacker)
+  defense = getTraits(defender)
+  return getHitChance(attack.level, attack.getAttackBonus(escaping),
+                      defense.level, defense.getDefenseBonus(escaping))
+
+def attackHits(attacker, defender, dice = None):
+  '''
+  Decide whether an attack succeeds with one random number instead of
+  two dice. The odds are the same as Character.attack but the rolls
+  themselves are never made. Uses the current Dice unless given others.
+  '''
+  if dice is None: dice = getDice()
+  return dice.random() < getAttackChance(attacker, defender)
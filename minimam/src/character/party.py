@@ -0,0 +1,134 @@
+# Copyright 2008 Seth Galbraith
+#
+# This file is part of Minimam.
+#
+# Minimam is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Minimam is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Minimam.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Keeps count of the condition of everyone in a party as it changes.
+
+Finding out whether a party is defeated, or who can be healed or
+attacked, means looking at every member of it. A PartyIndex is told by
+each Character when his health or stage of escape changes, so the
+answers are always ready: defeat is a single test and the target
+lists only cost as much as the targets.
+'''
+
+import bisect
+
+from character import HEALTHY, INJURED, INCAPACITATED, STAYING, LEAVING, GONE
+
+def isStanding(health, escape):
+  '''True if a character in this condition can be attacked.'''
+  return health != INCAPACITATED and escape != GONE
+
+def isWounded(health, escape):
+  '''True if a character in this condition can be healed.'''
+  return health != HEALTHY and escape == STAYING
+
+def insert(positions, position):
+  bisect.insort(positions, position)
+
+def remove(positions, position):
+  del positions[bisect.bisect_left(positions, position)]
+
+class PartyIndex(object):
+
+  '''The condition of each character in a party, kept up to date.'''
+
+  def __init__(self, characters):
+    '''
+    The characters are numbered in order, and are told to report
+    their changes to this index from now on.
+    '''
+    self.positions = {} # position of each character in the party
+    self.conditions = [] # (health, escape) at each position
+    self.healths = [0, 0, 0] # how many characters have each health
+    self.escapes = [0, 0, 0] # how many are at each stage of escape
+    self.standing = [] # positions of characters who can be attacked
+    self.wounded = [] # positions of characters who can be healed
+    for i in range(len(characters)):
+      character = characters[i]
+      self.positions[character] = i
+      self.conditions.append((character.health, character.escape))
+      self.add(i)
+      character.party = self
+
+  def add(self, position):
+    health, escape = self.conditions[position]
+    self.healths[health] = self.healths[health] + 1
+    self.escapes[escape] = self.escapes[escape] + 1
+    if isStanding(health, escape): insert(self.standing, position)
+    if isWounded(health, escape):  insert(self.wounded, position)
+
+  def remove(self, position):
+    health, escape = self.conditions[position]
+    self.healths[health] = self.healths[health] - 1
+    self.escapes[escape] = self.escapes[escape] - 1
+    if isStanding(health, escape): remove(self.standing, position)
+    if isWounded(health, escape):  remove(self.wounded, position)
+
+  def update(self, character):
+    '''Called by a character after his health or escape changes.'''
+    position = self.positions[character]
+    condition = character.health, character.escape
+    if condition == self.conditions[position]: return
+    self.remove(position)
+    self.conditions[position] = condition
+    self.add(position)
+
+  def countInjured(self):
+    return self.healths[INJURED]
+
+  def countIncapacitated(self):
+    return self.healths[INCAPACITATED]
+
+  def countEscaping(self):
+    return self.escapes[LEAVING]
+
+  def countGone(self):
+    return self.escapes[GONE]
+
+  def countStanding(self):
+    return len(self.standing)
+
+class Party(list):
+
+  '''
+  A list of the members of a party with a PartyIndex of their condition.
+  The members are Characters, or anything standing in for them in the
+  same order (such as Entities) sharing the index of their Characters.
+  Make a new Party instead of adding or removing members.
+  '''
+
+  def __init__(self, members = [], party_index = None):
+    list.__init__(self, members)
+    if party_index is None: party_index = PartyIndex(self)
+    self.party_index = party_index
+
+  def isDefeated(self):
+    '''True if the members are all incapacitated or gone.'''
+    return not self.party_index.standing
+
+  def hasGone(self):
+    '''True if any of the members escaped.'''
+    return self.party_index.escapes[GONE] > 0
+
+  def getHealingTargets(self):
+    '''The members who are not healthy or escaping, in order.'''
+    return [self[i] for i in self.party_index.wounded]
+
+  def getAttackTargets(self):
+    '''The members who are not incapacitated or gone, in order.'''
+    return [self[i] for i in self.party_index.standing]
@@ -18,7 +18,9 @@
 from character import Character
 
 class Priest(Character):
-  
+
+  __slots__ = ()
+
   def isHealer(self):
     return True
 
@@ -19,6 +19,8 @@ from character import Character
 
 class Rogue(Character):
 
+  __slots__ = ()
+
   def hideRoll(self):
     return self.roll() + 1
 
@@ -0,0 +1,89 @@
+# Copyright 2008 Seth Galbraith
+#
+# This file is part of Minimam.
+#
+# Minimam is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Minimam is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Minimam.  If not, see <http://www.gnu.org/licenses/>.
+
+from character import STAYING, LEAVING
+
+class Traits:
+
+  '''
+  The numbers behind a Character's class, for simulators which
+  work on whole arrays of characters instead of Character objects.
+  '''
+
+  def __init__(self, character):
+    '''
+    Find the class bonuses by asking the character's own methods,
+    so the numbers can never disagree with the Character classes.
+    '''
+    self.classname = character.__class__.__name__
+    self.level = character.getLevel()
+    self.first = character.isFirst()
+    self.healer = character.isHealer()
+    probe = _Probe(character.__class__)()
+    self.attack_bonus = probe.attackRoll(_Target(False))
+    self.escaping_attack_bonus = probe.attackRoll(_Target(True))
+    probe.escape = STAYING
+    self.defense_bonus = probe.defenseRoll(_Target(False))
+    probe.escape = LEAVING
+    self.escaping_defense_bonus = probe.defenseRoll(_Target(False))
+    target = _Target(False)
+    probe.hit(target)
+    self.fireball = target.damage == "fireball"
+
+  def getAttackBonus(self, target_escaping):
+    '''Bonus to attack rolls against an escaping or staying target.'''
+    if target_escaping: return self.escaping_attack_bonus
+    return self.attack_bonus
+
+  def getDefenseBonus(self, escaping):
+    '''Bonus to defense rolls while escaping or staying.'''
+    if escaping: return self.escaping_defense_bonus
+    return self.defense_bonus
+
+def _Probe(cls):
+  '''A subclass of a Character class whose dice always roll 0.'''
+  class Probe(cls):
+    __slots__ = ()
+    def roll(self):
+      return 0
+  return Probe
+
+class _Target:
+
+  '''A stand-in for a defender which remembers how it was hit.'''
+
+  def __init__(self, escaping):
+    self.escaping = escaping
+    self.damage = None
+
+  def isEscaping(self):
+    return self.escaping
+
+  def takeNormalDamage(self):
+    self.damage = "normal"
+
+  def takeFireballDamage(self):
+    self.damage = "fireball"
+
+# Traits only depend on class and level, so they are shared.
+traits = {}
+
+def getTraits(character):
+  '''Get the (shared) Traits for a character's class and level.'''
+  key = character.__class__, character.getLevel()
+  if key not in traits: traits[key] = Traits(character)
+  return traits[key]
@@ -19,6 +19,8 @@ from character import Character
 
 class Warrior(Character):
 
+  __slots__ = ()
+
   def attackRoll(self, other):
     return self.roll() + 1
 
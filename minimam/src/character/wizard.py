@@ -19,9 +19,7 @@ from character import Character
 
 class Wizard(Character):
 
-  def attack(self, other):
-    if self.attackRoll(other) > other.defenseRoll(other):
-      other.takeFireballDamage()
-      return True
-    else:
-      return False
+  __slots__ = ()
+
+  def hit(self, other):
+    other.takeFireballDamage()
@@ -22,13 +22,50 @@ STATES = "healthy", "injured", "incapacitated", "attack", "pain", "defend", "hea
 
 class Animation:
 	
-	def __init__(self, classname = None):
+	def __init__(self, classname = None, atlas = None, manifest = None):
+		'''
+		The frames are taken from the atlas (see combat.atlas) if it has
+		the class, otherwise they are loaded from separate image files,
+		listed in the manifest (see combat.manifest) if there is one.
+		'''
 		self.frames = {}
+		self.masks = {}
 		for direction in DIRECTIONS:
 			self.frames[direction] = {}
+			self.masks[direction] = {}
 			for state in STATES:
 				self.frames[direction][state] = None		
-		if classname is not None: self.loadFrames(classname)
+				self.masks[direction][state] = None
+		if classname is None: return
+		if atlas is not None and atlas.hasClass(classname.lower()):
+			self.loadAtlas(classname, atlas)
+		elif manifest is not None and manifest.hasClass(classname.lower()):
+			self.loadManifest(classname, manifest)
+		else:
+			self.loadFrames(classname)
+
+	def loadManifest(self, classname, manifest):
+		self.setFrames(manifest.loadFrames(classname.lower()))
+
+	def setFrames(self, frames):
+		'''
+		Use surfaces keyed by (state, direction), as made by
+		Manifest.loadFrames, converting them for fast drawing.
+		'''
+		converted = {}
+		for key, surface in frames.items():
+			if surface not in converted:
+				converted[surface] = surface.convert_alpha()
+			self.frames[key[1]][key[0]] = converted[surface]
+		self.buildMasks()
+
+	def loadAtlas(self, classname, atlas):
+		classname = classname.lower()
+		for direction in DIRECTIONS:
+			for state in STATES:
+				frame = atlas.getFrame(classname, state, direction)
+				self.frames[direction][state] = frame
+		self.buildMasks()
 		
 	def loadFrames(self, classname):
 		classname = classname.lower()
@@ -48,6 +85,25 @@ class Animation:
 						self.frames[direction][state] = surface
 					except pygame.error:
 						pass
+		self.buildMasks()
+
+	def buildMasks(self):
+		'''
+		Make a collision mask of the solid pixels of every frame (shared by
+		states which use the same frame), for hit testing without get_at.
+		'''
+		masks = {}
+		for direction in DIRECTIONS:
+			for state in STATES:
+				frame = self.getFrame(state, direction)
+				if frame is None: continue
+				if frame not in masks:
+					masks[frame] = pygame.mask.from_surface(frame, 254)
+				self.masks[direction][state] = masks[frame]
+
+	def getMask(self, state, direction):
+		'''The collision mask of a frame, with getFrame's substitutions.'''
+		return self.masks[direction].get(state)
 
 	def getFrame(self, state, direction):
 		frame = self.frames[direction][state]
@@ -0,0 +1,175 @@
+# Copyright 2008 Seth Galbraith
+#
+# This file is part of Minimam.
+#
+# Minimam is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Minimam is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Minimam.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Pack the frames of every character animation into a few large images.
+
+Opening and decoding dozens of small PNG files makes starting the game
+slow, so the build step (run "python -m combat.atlas" from the src
+directory after changing the graphics) copies every frame which
+Animation would load, including the flipped left-facing frames, into
+atlas pages (graphics/atlas-0.png, ...) and writes an index of where each
+frame is (graphics/atlas.txt). Animation loads the pages once and uses
+subsurfaces of them as its frames.
+
+Each line of the index is: class state direction page x y width height
+'''
+
+import os
+import sys
+
+import pygame
+
+from animation import DIRECTIONS, STATES
+from manifest import getManifest
+
+CLASSNAMES = "warrior", "rogue", "wizard", "priest", "monster", "dragon"
+DIRECTORY = "graphics"
+INDEX = "atlas.txt"
+PAGE = "atlas-%d.png"
+PAGE_SIZE = 1024 # width and greatest height of an atlas page
+PADDING = 1 # transparent pixels between frames
+
+def loadImages(classnames = CLASSNAMES, directory = DIRECTORY):
+  '''
+  Load every frame listed in the manifest (see combat.manifest) as a list
+  of ((class, state, direction), surface). Frames which use another
+  state's frame are left out (see Animation.getFrame).
+  '''
+  manifest = getManifest(directory)
+  images = []
+  for classname in classnames:
+    frames = manifest.loadFrames(classname)
+    for direction in DIRECTIONS:
+      for state in STATES:
+        source = manifest.getSource(classname, state, direction)
+        if source is None or source[0] == "same": continue
+        images.append(((classname, state, direction),
+                       frames[state, direction]))
+  return images
+
+def pack(sizes, size = PAGE_SIZE, padding = PADDING):
+  '''
+  Place rectangles of these (width, height) sizes on pages in rows,
+  tallest first. Returns a (page, x, y) for each size, in the same order.
+  '''
+  order = range(len(sizes))
+  order.sort(lambda a, b: cmp(sizes[b][1], sizes[a][1]))
+  places = [None] * len(sizes)
+  page, x, y, row = 0, 0, 0, 0
+  for i in order:
+    width, height = sizes[i]
+    if x + width > size: # start a new row
+      x, y, row = 0, y + row + padding, 0
+    if y + height > size: # start a new page
+      page, x, y, row = page + 1, 0, 0, 0
+    places[i] = page, x, y
+    x = x + width + padding
+    row = max(row, height)
+  return places
+
+def build(classnames = CLASSNAMES, directory = DIRECTORY):
+  '''Write the atlas pages and index. Returns the number of pages.'''
+  images = loadImages(classnames, directory)
+  sizes = [surface.get_size() for key, surface in images]
+  places = pack(sizes)
+  pages = []
+  for page, x, y in places:
+    if page >= len(pages): pages.append([0, 0])
+  for i in range(len(images)):
+    page, x, y = places[i]
+    width, height = sizes[i]
+    pages[page][0] = max(pages[page][0], x + width)
+    pages[page][1] = max(pages[page][1], y + height)
+  surfaces = [pygame.Surface(size, pygame.SRCALPHA, 32) for size in pages]
+  for surface in surfaces: surface.fill((0, 0, 0, 0))
+  index = open(os.path.join(directory, INDEX), "w")
+  try:
+    for i in range(len(images)):
+      (classname, state, direction), surface = images[i]
+      page, x, y = places[i]
+      surfaces[page].blit(surface, (x, y))
+      index.write("%s %s %s %d %d %d %d %d\n" % ((classname, state,
+                  direction, page, x, y) + sizes[i]))
+  finally:
+    index.close()
+  for page in range(len(surfaces)):
+    pygame.image.save(surfaces[page], os.path.join(directory, PAGE % page))
+  return len(surfaces)
+
+class Atlas:
+
+  '''The atlas pages and index, loaded once and shared by all Animations.'''
+
+  def __init__(self, directory = DIRECTORY, convert = True):
+    '''
+    Without convert the pages are only decoded, so the atlas can be
+    loaded on another thread (see combat.prefetch), and convert must be
+    called on the main thread before using it.
+    '''
+    self.rects = {}
+    pages = 0
+    for line in open(os.path.join(directory, INDEX)):
+      fields = line.split()
+      if len(fields) != 8: continue
+      classname, state, direction = fields[:3]
+      page, x, y, width, height = [int(field) for field in fields[3:]]
+      self.rects[classname, state, direction] = page, (x, y, width, height)
+      pages = max(pages, page + 1)
+    self.pages = []
+    for page in range(pages):
+      filename = os.path.join(directory, PAGE % page)
+      self.pages.append(pygame.image.load(filename))
+    if convert: self.convert()
+
+  def convert(self):
+    '''Convert the pages to the display format for fast drawing.'''
+    self.pages = [page.convert_alpha() for page in self.pages]
+
+  def hasClass(self, classname):
+    for key in self.rects:
+      if key[0] == classname: return True
+    return False
+
+  def getFrame(self, classname, state, direction):
+    '''A subsurface of an atlas page, or None if there is no such frame.'''
+    key = classname, state, direction
+    if key not in self.rects: return None
+    page, rect = self.rects[key]
+    return self.pages[page].subsurface(rect)
+
+atlas = None
+
+def getAtlas(directory = DIRECTORY):
+  '''Load the atlas the first time it is needed. None if it was not built.'''
+  global atlas
+  if atlas is None and os.path.exists(os.path.join(directory, INDEX)):
+    atlas = Atlas(directory)
+  return atlas
+
+def isAtlasLoaded():
+  return atlas is not None
+
+def setAtlas(new_atlas):
+  '''Use an atlas loaded some other way (see combat.prefetch).'''
+  global atlas
+  atlas = new_atlas
+
+if __name__ == "__main__":
+  pages = build()
+  sys.stdout.write("wrote %d atlas page(s) and %s to %s\n" %
+                   (pages, INDEX, DIRECTORY))
@@ -0,0 +1,311 @@
+# Copyright 2008 Seth Galbraith
+#
+# This file is part of Minimam.
+#
+# Minimam is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Minimam is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Minimam.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Large battles with hundreds of entities on each side.
+
+Fight moves its handful of entities one at a time, which is too slow
+for big crowds. In a Battle the positions, goals and speeds of all the
+entities are kept in NumPy arrays (see Crowd) and every tick moves them
+all with a few array operations; only the entities which reached their
+goals begin their nextState. Entities are placed in
+ranks instead of around the combat circle, everybody acts at once
+instead of taking turns, and each frame is drawn with one Surface.blits
+call (where Pygame has it). Blending hundreds of full size frames takes
+longer than a frame should, so the crowd is drawn smaller (see SCALE).
+
+Run it from the src directory: python -m combat.battle [entities per side]
+'''
+
+import math
+import sys
+
+import numpy
+import pygame
+
+from character.warrior import Warrior
+from character.monster import Monster
+from character.dice import getDice
+from character.party import Party
+from background import Background
+from engine import Engine, getOutcome, UNDECIDED
+from entity import Entity
+from fight import MAX_TICKS, MAX_SKIPPED
+
+SPACING = 40, 30 # distance between neighbours in the ranks, in pixels
+MARGIN = 100 # space between the ranks and the edges of the screen
+SCALE = 0.5 # size of the crowd's frames compared to a Fight's
+
+class Crowd:
+
+  '''
+  The kinematics of many entities, worked out for all of them at once.
+
+  The arrays are only copied from an entity again after something may
+  have changed its state (see change), and only the entities which are
+  moving get their positions copied back. An entity which arrives and
+  begins the same state again (standing at home, waiting to decide) is
+  resting: its nextState is not begun again until it is changed.
+  '''
+
+  def __init__(self, entities):
+    self.entities = entities
+    self.numbers = {} # where each entity is in the arrays
+    for i in range(len(entities)): self.numbers[entities[i]] = i
+    count = len(entities)
+    self.positions = numpy.zeros((count, 2))
+    self.previous = numpy.zeros((count, 2))
+    self.goals = numpy.zeros((count, 2))
+    self.speeds = numpy.zeros(count)
+    self.active = numpy.zeros(count, bool) # not incapacitated
+    self.moving = numpy.zeros(count, bool) # moved in the last tick
+    self.resting = numpy.zeros(count, bool)
+    self.changed = set()
+    self.gather()
+    self.previous[:] = self.positions
+
+  def gather(self):
+    '''Copy the positions, goals and speeds of all the entities.'''
+    entities = self.entities
+    self.positions[:] = [entity.position for entity in entities]
+    self.goals[:] = [entity.goal for entity in entities]
+    self.speeds[:] = [entity.speed for entity in entities]
+    self.active[:] = [not entity.isIncapacitated() for entity in entities]
+    self.resting[:] = False
+    self.changed.clear()
+
+  def change(self, entity):
+    '''Note that an entity's state may have changed since the last tick.'''
+    self.changed.add(entity)
+    self.resting[self.numbers[entity]] = False
+
+  def refresh(self):
+    '''Copy the changed entities into the arrays.'''
+    for entity in self.changed:
+      i = self.numbers[entity]
+      self.positions[i] = entity.position
+      self.goals[i] = entity.goal
+      self.speeds[i] = entity.speed
+      self.active[i] = not entity.isIncapacitated()
+    self.changed.clear()
+
+  def step(self):
+    '''
+    Move every active entity toward its goal, like Entity.move.
+    Returns the indexes of the entities which have arrived.
+    '''
+    self.previous[:] = self.positions
+    offsets = self.goals - self.positions
+    distances = numpy.sqrt((offsets * offsets).sum(1))
+    steps = numpy.where(self.active, numpy.minimum(distances, self.speeds), 0)
+    scale = steps / numpy.maximum(distances, 1e-9)
+    self.positions += offsets * scale[:, numpy.newaxis]
+    moving = steps > 0
+    self.scatter(numpy.nonzero(moving | self.moving)[0])
+    self.moving = moving
+    arrived = self.active & (distances - steps <= self.speeds)
+    return numpy.nonzero(arrived & ~self.resting)[0]
+
+  def scatter(self, indexes):
+    '''Copy the new positions back to some of the entities.'''
+    positions = self.positions[indexes].tolist()
+    previous = self.previous[indexes].tolist()
+    for i in range(len(indexes)):
+      entity = self.entities[indexes[i]]
+      entity.previous = tuple(previous[i])
+      entity.position = tuple(positions[i])
+
+  def tick(self):
+    '''Move every entity one tick and change the states of those arrived.'''
+    self.refresh()
+    for i in self.step():
+      entity = self.entities[i]
+      state = entity.nextState
+      entity.begin(state)
+      # a state can change the target too, and lie changes its target
+      self.change(entity)
+      target = entity.target
+      if target is not None:
+        self.change(target)
+        if target.target is not None: self.change(target.target)
+      self.resting[i] = entity.nextState == state
+
+def getRanks(count, area, NPC):
+  '''
+  Home positions for a party of count entities, in ranks filling the
+  left (PCs) or right (NPCs) half of area, a pygame Rect.
+  '''
+  half = area.width / 2 - SPACING[0]
+  columns = max(1, int(half / SPACING[0]))
+  rows = int(math.ceil(count / float(columns)))
+  columns = int(math.ceil(count / float(rows)))
+  step_x = min(SPACING[0], half / float(columns))
+  step_y = min(SPACING[1], area.height / float(max(rows, 1)))
+  homes = []
+  for i in range(count):
+    column, row = i % columns, i // columns
+    x = area.centerx - SPACING[0] - column * step_x
+    if NPC: x = 2 * area.centerx - x
+    y = area.bottom - row * step_y
+    homes.append((x, y))
+  return homes
+
+class Battle:
+
+  '''A fight between two crowds, with everybody acting at once.'''
+
+  def __init__(self, PCs, NPCs, rate = 0.02, scale = SCALE):
+    '''
+    rate is the chance each tick that an idle entity starts an action.
+    scale is the size of the frames drawn compared to the originals.
+    '''
+    self.delay = 30 # duration of a tick in milliseconds (as in Fight)
+    self.rate = rate
+    self.scale = scale
+    self.frames = {} # scaled frames by (animation, frame, direction)
+    self.quit = False
+    screen = pygame.display.get_surface()
+    width, height = screen.get_size()
+    self.background = Background('graphics/All_Gizah_Pyramids-cropped.jpg')
+    area = pygame.Rect(MARGIN, height / 3, width - 2 * MARGIN,
+                       height * 2 / 3 - 20)
+    self.engine = Engine(PCs, NPCs)
+    self.PCs = Party(self.makeEntities(PCs, area, False),
+                     self.engine.PCs.party_index)
+    self.NPCs = Party(self.makeEntities(NPCs, area, True),
+                      self.engine.NPCs.party_index)
+    self.entities = self.PCs + self.NPCs
+    self.crowd = Crowd(self.entities)
+    self.drawn = 0 # number of frames drawn
+
+  def makeEntities(self, characters, area, NPC):
+    ring = pygame.Rect(area)
+    entities = []
+    homes = getRanks(len(characters), area, NPC)
+    for i in range(len(characters)):
+      entity = Entity(characters[i], i, len(characters), NPC, ring,
+                      self.engine)
+      x, y = homes[i]
+      entity.home = entity.position = entity.previous = x, y
+      # wait for a decision a little way in front of home
+      if NPC: entity.center = x - SPACING[0], y
+      else:   entity.center = x + SPACING[0], y
+      entity.exit = entity.exit[0], y
+      entity.stand()
+      entities.append(entity)
+    return entities
+
+  def act(self):
+    '''Let some idle entities start an action, and let others decide.'''
+    dice = getDice()
+    crowd = self.crowd
+    # only resting entities can be waiting to decide or finished
+    for i in numpy.nonzero(crowd.resting)[0]:
+      entity = self.entities[i]
+      if entity.isThinking():
+        if entity.isNPC(): entity.randomAction(self.NPCs, self.PCs)
+        else:              entity.randomAction(self.PCs, self.NPCs)
+        crowd.change(entity)
+      elif dice.random() < self.rate and entity.isTurnOver():
+        if not (entity.isIncapacitated() or entity.isGone()):
+          self.engine.beginTurn(entity.character)
+          entity.startTurn()
+          crowd.change(entity)
+
+  def getFrame(self, entity):
+    '''The entity's current frame, scaled the first time it is needed.'''
+    key = entity.animation, entity.frame, entity.direction
+    surface = self.frames.get(key)
+    if surface is None:
+      surface = entity.animation.getFrame(entity.frame, entity.direction)
+      if self.scale != 1.0:
+        width, height = surface.get_size()
+        size = int(width * self.scale), int(height * self.scale)
+        surface = pygame.transform.smoothscale(surface, size)
+      self.frames[key] = surface
+    return surface
+
+  def input(self):
+    for event in pygame.event.get():
+      if event.type == pygame.QUIT: self.quit = True
+      elif event.type == pygame.KEYDOWN:
+        if event.key == pygame.K_ESCAPE: self.quit = True
+
+  def draw(self, blend = 1.0):
+    '''Draw every entity with one blits call, from back to front.'''
+    screen = pygame.display.get_surface()
+    self.background.draw()
+    crowd = self.crowd
+    positions = crowd.previous + (crowd.positions - crowd.previous) * blend
+    order = numpy.argsort(positions[:, 1], kind = "mergesort")
+    positions = positions.tolist()
+    blits = []
+    for i in order:
+      entity = self.entities[i]
+      if entity.character.isGone() and entity.isAtGoal(): continue
+      surface = self.getFrame(entity)
+      x, y = positions[i]
+      blits.append((surface, (int(x) - surface.get_width() / 2,
+                              int(y) - surface.get_height())))
+    if hasattr(screen, "blits"): screen.blits(blits, False)
+    else:
+      for surface, position in blits: screen.blit(surface, position)
+    pygame.display.flip()
+    self.drawn = self.drawn + 1
+
+  def loop(self):
+    '''
+    Play until one side is defeated, with the same fixed-timestep clock
+    as Fight.turn. Returns the outcome (see combat.engine).
+    '''
+    clock = pygame.time.Clock()
+    last = pygame.time.get_ticks()
+    lag = 0
+    skipped = 0
+    while not self.quit:
+      outcome = getOutcome(self.PCs, self.NPCs)
+      if outcome != UNDECIDED: return outcome
+      now = pygame.time.get_ticks()
+      lag = min(lag + now - last, self.delay * MAX_TICKS)
+      last = now
+      self.input()
+      ticks = 0
+      while lag >= self.delay:
+        self.act()
+        self.crowd.tick()
+        lag = lag - self.delay
+        ticks = ticks + 1
+      if ticks > 1 and skipped < MAX_SKIPPED:
+        skipped = skipped + 1
+      else:
+        self.draw(min(lag / float(self.delay), 1.0))
+        skipped = 0
+      clock.tick(60)
+    return UNDECIDED
+
+if __name__ == "__main__":
+  count = 250
+  if len(sys.argv) > 1: count = int(sys.argv[1])
+  pygame.init()
+  pygame.display.set_mode((1280, 800))
+  battle = Battle([Warrior() for i in range(count)],
+                  [Monster() for i in range(count)])
+  start = pygame.time.get_ticks()
+  outcome = battle.loop()
+  seconds = (pygame.time.get_ticks() - start) / 1000.0
+  sys.stdout.write("%d frames in %.1f seconds (%.1f per second)\n" %
+                   (battle.drawn, seconds, battle.drawn / seconds))
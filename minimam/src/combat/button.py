@@ -41,5 +41,7 @@ class Button:
     return self.rect.collidepoint(x, y)
   
   def draw(self, selected = False):
-    pygame.display.get_surface().blit(self.surfaces[selected], self.rect)
+    '''Draw the button. Returns the part of the screen drawn on.'''
+    return pygame.display.get_surface().blit(self.surfaces[selected],
+                                             self.rect)
     
\ No newline at end of file
@@ -0,0 +1,318 @@
+# Copyright 2008 Seth Galbraith
+#
+# This file is part of Minimam.
+#
+# Minimam is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Minimam is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Minimam.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+The rules of combat without any graphics.
+
+Everything in this module works on Characters, or on anything else
+with the same isFirst, isHealer, isHealthy, isInjured, isIncapacitated,
+isEscaping and isGone methods (such as Entities), and never imports pygame.
+Parties given as a character.party.Party are not searched, their index
+already knows who is defeated and who can be healed or attacked.
+'''
+
+from character.dice import getDice, setDice
+from character.odds import attackHits
+from character.party import Party
+
+# actions a character can choose on his turn
+NOTHING = 0
+ESCAPE = 1
+HEAL = 2
+ATTACK = 3
+
+# outcomes of a fight (from the point of view of the player characters)
+UNDECIDED = 0
+WIN = 1
+FLEE = 2
+LOSS = 3
+STALEMATE = 4
+
+def splitByClass(entities):
+  '''Separate Rogues and Dragons from other characters.'''
+  slow, fast = [], []
+  for entity in entities:
+    if entity.isFirst(): fast.append(entity)
+    else:                slow.append(entity)
+  return fast, slow
+
+def alternateTurns(first, second):
+  '''
+  Combine two lists, alternating items from 1st and 2nd list
+  until there are no more items in the one of the lists,
+  with the remaining items from the longer list at the end.
+  '''
+  turns = []
+  for i in range(max(len(first), len(second))):
+    if (i < len(first)):  turns.append(first[i])
+    if (i < len(second)): turns.append(second[i])
+  return turns
+
+def isDefeated(entities):
+  '''True if these entities are all incapacitated or gone'''
+  if isinstance(entities, Party): return entities.isDefeated()
+  for entity in entities:
+    if not (entity.isIncapacitated() or entity.isGone()):
+      return False
+  return True
+
+def sortedTurns(PCs, NPCs):
+  '''Combine the PC and NPC lists in the order of the character's turns.'''
+  fastPCs,  slowPCs  = splitByClass(PCs)
+  fastNPCs, slowNPCs = splitByClass(NPCs)
+  fast = alternateTurns(fastPCs, fastNPCs)
+  slow = alternateTurns(slowPCs, slowNPCs)
+  return fast + slow
+
+def getHealingTargets(allies):
+  '''Get a list of all allies who are not healthy or escaping.'''
+  if isinstance(allies, Party): return allies.getHealingTargets()
+  targets = []
+  for ally in allies:
+    if not (ally.isHealthy() or ally.isEscaping() or ally.isGone()):
+      targets.append(ally)
+  return targets
+
+def getAttackTargets(enemies):
+  '''Get a list of all enemies who are not incapacitated or gone.'''
+  if isinstance(enemies, Party): return enemies.getAttackTargets()
+  targets = []
+  for enemy in enemies:
+    if not (enemy.isGone() or enemy.isIncapacitated()):
+      targets.append(enemy)
+  return targets
+
+def chooseRandomAction(actor, allies, enemies):
+  '''
+  Choose to escape, heal or attack a random target.
+  Returns an (action, target) pair. Injured healers heal themselves
+  and other injured characters escape. The target is None for escaping
+  and for NOTHING, which is only chosen when nobody can be attacked.
+  '''
+  if actor.isInjured():
+    if actor.isHealer(): return HEAL, actor
+    else:                return ESCAPE, None
+  if actor.isHealer():
+    healing_targets = getHealingTargets(allies)
+    if len(healing_targets) > 0:
+      return HEAL, getDice().choice(healing_targets)
+  attack_targets = getAttackTargets(enemies)
+  if len(attack_targets) > 0:
+    return ATTACK, getDice().choice(attack_targets)
+  return NOTHING, None
+
+def getOutcome(PCs, NPCs):
+  '''Find out how the fight between these parties ended (if it has).'''
+  if isDefeated(PCs):
+    if isinstance(PCs, Party):
+      if PCs.hasGone(): return FLEE
+      return LOSS
+    for character in PCs:
+      if character.isGone(): return FLEE
+    return LOSS
+  if isDefeated(NPCs): return WIN
+  return UNDECIDED
+
+class Engine:
+
+  '''
+  Resolves fights between two parties of Characters using the same rules
+  and turn order as the animated Fight, but as fast as the CPU allows.
+  '''
+
+  def __init__(self, PCs = [], NPCs = [], rounds = 1000, analytic = False,
+               dice = None, log = None, PC_policy = None, NPC_policy = None):
+    '''
+    rounds limits the length of a fight, because some fights
+    (such as two Priests healing themselves) never end by themselves.
+    analytic decides attacks with one random number (see character.odds)
+    instead of an attack roll and a defense roll.
+    dice are used for every random number in the fight if given,
+    so a fight with seeded Dice (see character.dice) can be repeated.
+    (A log replaces them with Dice spawned from them now and then.)
+    log records the fights so they can be replayed
+    (see combat.log.FightLog).
+    PC_policy and NPC_policy choose the actions of each party
+    (see combat.policy). Parties without one choose at random.
+    '''
+    self.rounds = rounds
+    self.analytic = analytic
+    self.dice = dice
+    self.log = log
+    self.PC_policy = PC_policy
+    self.NPC_policy = NPC_policy
+    self.PCs, self.NPCs = [], []
+    self.setPlayerCharacters(PCs)
+    self.setNonPlayerCharacters(NPCs)
+
+  def setPlayerCharacters(self, PCs):
+    self.PCs = Party(PCs)
+    self.setIndexes()
+
+  def setNonPlayerCharacters(self, NPCs):
+    self.NPCs = Party(NPCs)
+    self.setIndexes()
+
+  def setIndexes(self):
+    '''Number the characters (PCs first) for the log.'''
+    self.indexes = {}
+    characters = self.PCs + self.NPCs
+    for i in range(len(characters)): self.indexes[characters[i]] = i
+
+  def getIndex(self, character):
+    '''The number of a character (PCs first) in the log, or None.'''
+    return self.indexes.get(character)
+
+  def sortedCharacters(self):
+    '''Combine the PC and NPC lists in the order of the character's turns.'''
+    return sortedTurns(self.PCs, self.NPCs)
+
+  def isNPC(self, character):
+    '''True if the character is one of the NPCs (found by his index).'''
+    return character.party is self.NPCs.party_index
+
+  def getAllies(self, character):
+    if self.isNPC(character): return self.NPCs
+    return self.PCs
+
+  def getEnemies(self, character):
+    if self.isNPC(character): return self.PCs
+    return self.NPCs
+
+  def getPolicy(self, character):
+    if self.isNPC(character): return self.NPC_policy
+    return self.PC_policy
+
+  def restore(self):
+    '''Heal everyone and bring back characters who escaped.'''
+    for character in self.PCs + self.NPCs: character.restore()
+
+  # ACTIONS
+
+  def beginTurn(self, character):
+    '''Call this when a character who can act starts his turn.'''
+    pass
+
+  def startTurn(self, character):
+    '''
+    Characters who were escaping at the start of their turn get away.
+    Returns True if the character can still choose an action.
+    '''
+    if character.isIncapacitated() or character.isGone(): return False
+    self.beginTurn(character)
+    if character.isEscaping():
+      self.finishEscaping(character)
+      return False
+    return True
+
+  def escape(self, character):
+    character.startEscaping()
+
+  def finishEscaping(self, character):
+    character.finishEscaping()
+
+  def heal(self, character, target):
+    target.heal()
+
+  def attack(self, character, target):
+    '''Returns True if the attack is successful.'''
+    if not self.analytic: return character.attack(target)
+    if not attackHits(character, target): return False
+    character.hit(target)
+    return True
+
+  def choose(self, character, action, target):
+    '''
+    Call this when a player (or a policy which isn't repeatable, see
+    combat.policy) has chosen an action, so the log can repeat it.
+    '''
+    if self.log is None: return
+    self.log.choose(self.getIndex(character), action, self.getIndex(target))
+
+  def perform(self, character, action, target):
+    '''Carry out an action chosen by chooseRandomAction or by a player.'''
+    if   action == ESCAPE: self.escape(character)
+    elif action == HEAL:   self.heal(character, target)
+    elif action == ATTACK: self.attack(character, target)
+
+  def turn(self, character):
+    '''One character's turn, choosing an action with his party's policy.'''
+    if not self.startTurn(character): return
+    allies = self.getAllies(character)
+    enemies = self.getEnemies(character)
+    policy = self.getPolicy(character)
+    if policy is None:
+      action, target = chooseRandomAction(character, allies, enemies)
+    else:
+      action, target = policy.choose(character, allies, enemies)
+      if self.log is not None and not policy.repeatable:
+        self.choose(character, action, target)
+    self.perform(character, action, target)
+
+  # RESOLUTION
+
+  def getOutcome(self):
+    return getOutcome(self.PCs, self.NPCs)
+
+  def startFight(self):
+    '''
+    Call this before the first turn of a fight. The log may switch to
+    new Dice (see combat.log), which are then kept for the fights after.
+    '''
+    if self.log is None: return
+    current = getDice()
+    dice = self.log.start(self.PCs, self.NPCs, self.PC_policy,
+                          self.NPC_policy, current)
+    if dice is current: return
+    setDice(dice)
+    if self.dice is not None: self.dice = dice
+
+  def endFight(self, outcome, turns):
+    '''Call this when the fight is over, after this many turns.'''
+    if self.log is not None: self.log.end(outcome, turns)
+
+  def resolve(self):
+    '''
+    Take turns until the PCs or NPCs are defeated.
+    Returns the outcome and the number of turns taken.
+    '''
+    if self.dice is None: return self.takeTurns()
+    previous = setDice(self.dice)
+    try:
+      return self.takeTurns()
+    finally:
+      setDice(previous)
+
+  def takeTurns(self):
+    self.startFight()
+    outcome, turns = self.playRounds()
+    self.endFight(outcome, turns)
+    return outcome, turns
+
+  def playRounds(self):
+    characters = self.sortedCharacters()
+    turns = 0
+    for i in range(self.rounds):
+      for character in characters:
+        outcome = self.getOutcome()
+        if outcome != UNDECIDED: return outcome, turns
+        if character.isIncapacitated() or character.isGone(): continue
+        self.turn(character)
+        turns = turns + 1
+    outcome = self.getOutcome()
+    if outcome == UNDECIDED: outcome = STALEMATE
+    return outcome, turns
@@ -17,19 +17,74 @@
 
 import pygame
 import math
-import random
 from animation import Animation
+from atlas import getAtlas
+from manifest import getManifest
+import engine
 
 WHITE = 255, 255, 255
 GRAY  = 64, 64, 64
 BLACK = 0, 0, 0
 
+# speeds in pixels per tick of the fight's clock (see Fight.delay)
 SLOW = 20
 FAST = 30
 
 RECOIL = 100
 SIDESTEP = 50
 
+# STATES by number. The first four are the states which end a turn
+# (see isTurnOver), so that is a single comparison.
+STAND          = 0
+RUN            = 1
+LIE            = 2
+FEAR           = 3
+WAIT           = 4
+HIT            = 5
+DEFEND         = 6
+HEAL_SELF      = 7
+HEAD_TO_ATTACK = 8
+BEGIN_ATTACK   = 9
+FINISH_ATTACK  = 10
+HEAD_TO_HEAL   = 11
+BEGIN_HEALING  = 12
+FINISH_HEALING = 13
+
+# where the goal of a state is
+HOME     = 0 # the entity's home position
+HERE     = 1 # where the entity is
+CENTER   = 2 # the middle of the combat circle
+EXIT     = 3 # just off the edge of the screen
+TARGET   = 4 # where the target is
+APPROACH = 5 # most of the way to the target's home
+RETREAT  = 6 # most of the way from home to the target's home
+BEHIND   = 7 # a recoil's distance back
+
+# which way a state faces (for PCs, NPCs face the other way)
+FORWARD  = 0
+REVERSED = 1
+DIRECTIONS = "right", "left"
+
+HEALTH = 0 # frame showing the entity's health ("healthy" or "injured")
+
+# The goal, next state, facing, frame and speed of each state.
+# None leaves them as they were (defend decides them itself).
+RULES = (
+  (HOME,     STAND,          FORWARD,  HEALTH,          None), # STAND
+  (EXIT,     RUN,            REVERSED, HEALTH,          None), # RUN
+  (HERE,     LIE,            None,     "incapacitated", None), # LIE
+  (HOME,     FEAR,           REVERSED, HEALTH,          None), # FEAR
+  (CENTER,   WAIT,           FORWARD,  HEALTH,          None), # WAIT
+  (HOME,     STAND,          FORWARD,  None,            None), # HIT
+  (HOME,     None,           None,     None,            None), # DEFEND
+  (BEHIND,   STAND,          FORWARD,  None,            None), # HEAL_SELF
+  (APPROACH, BEGIN_ATTACK,   FORWARD,  HEALTH,          None), # HEAD_TO_ATTACK
+  (TARGET,   FINISH_ATTACK,  FORWARD,  "attack",        FAST), # BEGIN_ATTACK
+  (RETREAT,  STAND,          FORWARD,  "attack",        SLOW), # FINISH_ATTACK
+  (APPROACH, BEGIN_HEALING,  REVERSED, HEALTH,          None), # HEAD_TO_HEAL
+  (TARGET,   FINISH_HEALING, REVERSED, "heal",          None), # BEGIN_HEALING
+  (RETREAT,  STAND,          REVERSED, "heal",          None)) # FINISH_HEALING
+
 # Store animations in a dictionary with character class names as keys
 # ("Warrior", "Rogue", "Wizard", "Priest", "Monster", "Dragon")
 # so we don't duplicate animations for characters of the same class.
@@ -39,19 +94,23 @@ class Entity:
 
   '''A container for characters which adds animation and movement'''
 
-  def __init__(self, character, order, allies, NPC, ring):
+  def __init__(self, character, order, allies, NPC, ring, engine):
     '''
     order indicates the entity's position in his party
     (0 = first, 1 = second, 2 = third, etc.)
     allies indicates the size of the entity's party.
     ring is a pygame Rect with the position and size of the combat circle.
+    engine is the combat.engine.Engine which applies the rules.
     push is the distance a character moves back when attacked.
-    speed is the distance a character moves each frame.
+    speed is the distance a character moves each tick.
     '''
     classname = character.__class__.__name__
     if classname not in animations:
-        animations[classname] = Animation(classname)
+        animations[classname] = Animation(classname, getAtlas(),
+                                          getManifest())
     self.character = character
+    self.engine    = engine
+    self.NPC       = NPC
     self.animation = animations[classname]
     self.center    = ring.center
     self.speed     = SLOW # distance moved by characters each turn
@@ -72,152 +131,132 @@ class Entity:
       self.home = ring.centerx - x, ring.centery - y
       self.exit = -margin,          ring.centery - y
     self.position = self.home
+    self.previous = self.position # position at the last tick
+    self.index = None # the combat.spatial.SpatialIndex listing the entity
     self.stand()
 
   # STATES
+  # Every state is begun by begin, following its line of RULES and then
+  # calling its entry in ACTIONS (if any) for what the table can't say.
+
+  def begin(self, state):
+    '''Begin one of the states (STAND, LIE, HIT and so on)'''
+    goal, following, facing, frame, speed = RULES[state]
+    if   goal == HOME:     self.goal = self.home
+    elif goal == HERE:     self.goal = self.position
+    elif goal == CENTER:   self.goal = self.center
+    elif goal == EXIT:     self.goal = self.exit
+    elif goal == TARGET:   self.goal = self.target.position
+    elif goal == APPROACH: self.goal = self.getNear(self.position)
+    elif goal == RETREAT:  self.goal = self.getNear(self.home)
+    elif goal == BEHIND:   self.goal = self.getBehind()
+    if following is not None: self.nextState = following
+    if facing is not None: self.direction = DIRECTIONS[self.backward ^ facing]
+    if frame == HEALTH:
+      if self.isHealthy(): self.frame = "healthy"
+      else:                self.frame = "injured"
+    elif frame is not None: self.frame = frame
+    if speed is not None: self.speed = speed
+    action = ACTIONS[state]
+    if action is not None: action(self)
+
+  def getNear(self, start):
+    '''Most of the way from start to the target's home'''
+    return ((0.30 * start[0] + 0.70 * self.target.home[0]),
+            (0.30 * start[1] + 0.70 * self.target.home[1]))
+
+  def getBehind(self):
+    '''A recoil's distance back from the current position'''
+    if self.backward: return self.position[0] + RECOIL, self.position[1]
+    else:             return self.position[0] - RECOIL, self.position[1]
 
   def stand(self):
     '''Begin the standing still state'''
-    self.goal = self.home
-    self.nextState = self.stand
-    if self.backward: self.direction = "left"
-    else:             self.direction = "right"
-    if self.isHealthy(): self.frame = "healthy"
-    else:                self.frame = "injured"
+    self.begin(STAND)
     
   def lie(self):
     '''Begin the lying down state'''
-    self.goal = self.position
-    self.nextState = self.lie
-    self.frame = "incapacitated"
+    self.begin(LIE)
     
   def hit(self):
     '''Begin the recoil-from-successful-attack state'''
-    self.goal = self.home
-    self.nextState = self.stand
-    if self.backward:
-        self.direction = "left"
-        self.position = self.position[0] + RECOIL, self.position[1]
-    else:
-        self.direction = "right"
-        self.position = self.position[0] - RECOIL, self.position[1]
-    self.frame == "pain"
+    self.begin(HIT)
 
   def defend(self):
     '''Begin the avoided-attack state'''
-    self.goal = self.home
-    if self.isEscaping():
-      self.nextState = self.fear
-      if self.backward: self.direction = "right"
-      else:             self.direction = "left"
-    else:
-      self.nextState = self.stand
-      if self.backward: self.direction = "left"
-      else:             self.direction = "right"
-    self.position = self.position[0], self.position[1] + SIDESTEP
-    self.frame == "block"
+    self.begin(DEFEND)
 
   def healSelf(self):
     '''Begin the heal-self state'''
-    self.nextState = self.stand
-    self.frame == "injured"
-    if self.backward:
-      self.direction = "left"
-      self.goal = self.position[0] + RECOIL, self.position[1]
-    else:
-      self.direction = "right"
-      self.goal = self.position[0] - RECOIL, self.position[1]
-    self.character.heal()
+    self.begin(HEAL_SELF)
       
   def fear(self):
     '''Begin the trying-to-escape state'''
-    self.goal = self.home
-    self.nextState = self.fear
-    if self.backward: self.direction = "right" # notice reversed direction
-    else:             self.direction = "left"  # notice reversed direction
-    if self.isHealthy(): self.frame = "healthy"
-    else:                self.frame = "injured"
-    self.character.startEscaping()
+    self.begin(FEAR)
        
   def run(self):
     '''Begin the successfully-escaped state'''
-    self.goal = self.exit
-    self.nextState = self.run
-    if self.backward: self.direction = "right" # notice reversed direction
-    else:             self.direction = "left"  # notice reversed direction
-    if self.isHealthy(): self.frame = "healthy"
-    else:                self.frame = "injured"
-    self.character.finishEscaping()
+    self.begin(RUN)
        
   def wait(self):
     '''Begin the waiting-for-decision state'''
-    self.goal = self.center
-    self.nextState = self.wait
-    if self.backward: self.direction = "left"
-    else:             self.direction = "right"
-    if self.isHealthy(): self.frame = "healthy"
-    else:                self.frame = "injured"
+    self.begin(WAIT)
     
   def headToAttack(self):
     '''Begin the heading-to-attack-an-enemy state'''
-    self.goal = ((0.30 * self.position[0] + 0.70 * self.target.home[0]),
-                 (0.30 * self.position[1] + 0.70 * self.target.home[1]))
-    self.nextState = self.beginAttack
-    if self.backward: self.direction = "left"
-    else:             self.direction = "right"
-    if self.isHealthy(): self.frame = "healthy"
-    else:                self.frame = "injured"
+    self.begin(HEAD_TO_ATTACK)
     
   def beginAttack(self):
     '''Begin the starting-to-attack state'''
-    self.goal = self.target.position
-    self.nextState = self.finishAttack
-    if self.backward: self.direction = "left"
-    else:             self.direction = "right"
-    self.frame = "attack"
-    self.speed = FAST
+    self.begin(BEGIN_ATTACK)
     
   def finishAttack(self):
     '''Begin the finishing-an-attack state'''
-    self.goal = ((0.30 * self.home[0] + 0.70 * self.target.home[0]),
-                 (0.30 * self.home[1] + 0.70 * self.target.home[1]))
-    self.nextState = self.stand
-    if self.backward: self.direction = "left"
-    else:             self.direction = "right"
-    self.frame = "attack"
-    success = self.character.attack(self.target.character)
-    if self.target.isIncapacitated(): self.target.lie()
-    elif success:                     self.target.hit()
-    else:                             self.target.defend()
-    self.speed = SLOW
+    self.begin(FINISH_ATTACK)
 
   def headToHeal(self):
     '''Begin the heading-to-heal-an-ally state'''
-    self.goal = ((0.30 * self.position[0] + 0.70 * self.target.home[0]),
-                 (0.30 * self.position[1] + 0.70 * self.target.home[1]))
-    self.nextState = self.beginHealing
-    if self.backward: self.direction = "right" # notice reversed direction
-    else:             self.direction = "left"  # notice reversed direction
-    if self.isHealthy(): self.frame = "healthy"
-    else:                self.frame = "injured"
+    self.begin(HEAD_TO_HEAL)
     
   def beginHealing(self):
     '''Begin the starting-to-heal state'''
-    self.goal = self.target.position
-    self.nextState = self.finishHealing
-    if self.backward: self.direction = "right" # notice reversed direction
-    else:             self.direction = "left"  # notice reversed direction
-    self.frame = "heal"
+    self.begin(BEGIN_HEALING)
     
   def finishHealing(self):
     '''Begin the finishing-a-healing state'''
-    self.goal = ((0.30 * self.home[0] + 0.70 * self.target.home[0]),
-                 (0.30 * self.home[1] + 0.70 * self.target.home[1]))
-    self.nextState = self.stand
-    if self.backward: self.direction = "right" # notice reversed direction
-    else:             self.direction = "left"  # notice reversed direction
-    self.frame = "heal"
-    self.target.character.heal()
+    self.begin(FINISH_HEALING)
+
+  # ACTIONS OF THE STATES
+
+  def recoil(self):
+    self.position = self.getBehind()
+
+  def sidestep(self):
+    if self.isEscaping():
+      self.nextState = FEAR
+      self.direction = DIRECTIONS[self.backward ^ REVERSED]
+    else:
+      self.nextState = STAND
+      self.direction = DIRECTIONS[self.backward ^ FORWARD]
+    self.position = self.position[0], self.position[1] + SIDESTEP
+
+  def healMyself(self):
+    self.engine.heal(self.character, self.character)
+
+  def flee(self):
+    if not self.isEscaping(): self.engine.escape(self.character)
+
+  def getAway(self):
+    if not self.isGone(): self.engine.finishEscaping(self.character)
+
+  def strike(self):
+    success = self.engine.attack(self.character, self.target.character)
+    if self.target.isIncapacitated(): self.target.lie()
+    elif success:                     self.target.hit()
+    else:                             self.target.defend()
+
+  def healTarget(self):
+    self.engine.heal(self.character, self.target.character)
     if self.target.isEscaping(): self.target.fear()
     else:                        self.target.stand()
     
@@ -231,16 +270,37 @@ class Entity:
 
   def move(self):
     '''Move toward goal and do next state on arrival'''
-    if self.isIncapacitated(): return
-    x = self.goal[0] - self.position[0]
-    y = self.goal[1] - self.position[1]
-    distance = math.sqrt(x * x + y * y)
-    if distance > self.speed:
-      x = x * self.speed / distance
-      y = y * self.speed / distance
-    self.position = (self.position[0] + x,
-                     self.position[1] + y)
-    if self.isAtGoal(): self.nextState()
+    self.previous = self.position
+    if not self.isIncapacitated():
+      x = self.goal[0] - self.position[0]
+      y = self.goal[1] - self.position[1]
+      distance = math.sqrt(x * x + y * y)
+      if distance > self.speed:
+        x = x * self.speed / distance
+        y = y * self.speed / distance
+      self.position = (self.position[0] + x,
+                       self.position[1] + y)
+      if self.isAtGoal(): self.begin(self.nextState)
+    if self.index is not None: self.index.update(self)
+
+  def settle(self):
+    '''Jump to the goal and begin the next state, as if moved there'''
+    if self.isIncapacitated() or self.isAtGoal(): return
+    self.previous = self.position = self.goal
+    self.begin(self.nextState)
+    if self.index is not None: self.index.update(self)
+
+  def takePlace(self):
+    '''Stand, lie or leave at once, as the character's condition shows'''
+    self.target = None
+    self.previous = self.position = self.home
+    if   self.isIncapacitated(): self.lie()
+    elif self.isGone():
+      self.run()
+      self.previous = self.position = self.exit
+    elif self.isEscaping():      self.fear()
+    else:                        self.stand()
+    if self.index is not None: self.index.update(self)
 
   def startTurn(self):
     if self.isEscaping(): self.run()
@@ -248,66 +308,95 @@ class Entity:
 
   def getHealingTargets(self, allies):
     '''Get a list of all allies who are not healthy or escaping.'''
-    targets = []
-    for ally in allies:
-      if not (ally.isHealthy() or ally.isEscaping() or ally.isGone()):
-        targets.append(ally)
-    return targets
+    return engine.getHealingTargets(allies)
 
   def getAttackTargets(self, enemies):
     '''Get a list of all enemies who are not incapacitated or gone.'''
-    targets = []
-    for enemy in enemies:
-      if not (enemy.isGone() or enemy.isIncapacitated()):
-        targets.append(enemy)
-    return targets
+    return engine.getAttackTargets(enemies)
 
   def randomAction(self, allies, enemies):
     '''Escape, heal or attack a random target.'''
-    healing_targets = self.getHealingTargets(allies)
-    attack_targets = self.getAttackTargets(enemies)
-    if self.isInjured():
-      if self.isHealer(): self.healSelf()
-      else: self.fear()
-    elif self.isHealer() and len(healing_targets) > 0:
-      self.target = random.choice(healing_targets)
+    action, target = engine.chooseRandomAction(self, allies, enemies)
+    self.performAction(action, target)
+
+  def performAction(self, action, target):
+    '''Start an action (see combat.engine) against a target entity.'''
+    if action == engine.ESCAPE: self.fear()
+    elif action == engine.HEAL and target is self: self.healSelf()
+    elif action == engine.HEAL:
+      self.target = target
       self.headToHeal()
-    elif len(attack_targets) > 0:
-      self.target = random.choice(attack_targets)
+    elif action == engine.ATTACK:
+      self.target = target
       self.headToAttack()
 
   # RENDERING      
 
-  def isMouseOver(self):
-    '''Return True if the mouse is currently hovering over the entity.'''
+  def getPosition(self, blend = 1.0):
+    '''
+    Where to draw the entity between ticks: blend goes from 0.0
+    (the position at the last tick) to 1.0 (the current position).
+    '''
+    x = self.previous[0] + (self.position[0] - self.previous[0]) * blend
+    y = self.previous[1] + (self.position[1] - self.previous[1]) * blend
+    return x, y
+
+  def getRect(self, blend = 1.0):
+    '''The part of the screen covered by the entity's current frame.'''
     surface = self.animation.getFrame(self.frame, self.direction)
     rectangle = surface.get_rect()
-    rectangle.midbottom = self.position
+    rectangle.midbottom = self.getPosition(blend)
+    return rectangle
+
+  def isMouseOver(self):
+    '''Return True if the mouse is currently hovering over the entity.'''
     x, y = pygame.mouse.get_pos()
-    if rectangle.collidepoint(x, y):
-      color = surface.get_at((x - rectangle.left, y - rectangle.top))
-      if color[3] == 255: return True
-    return False
-
-  def draw(self):
-    '''Draw the entity in his current state and position'''
-    if self.character.isGone() and self.isAtGoal(): return
+    return self.isSolidAt(x, y)
+
+  def isSolidAt(self, x, y):
+    '''True if there is a solid (opaque) pixel of the entity at x, y.'''
     surface = self.animation.getFrame(self.frame, self.direction)
     rectangle = surface.get_rect()
     rectangle.midbottom = self.position
-    pygame.display.get_surface().blit(surface, rectangle)
+    if not rectangle.collidepoint(x, y): return False
+    mask = self.animation.getMask(self.frame, self.direction)
+    return mask.get_at((x - rectangle.left, y - rectangle.top)) == 1
+
+  def overlaps(self, other):
+    '''True if solid pixels of the two entities' frames overlap.'''
+    rectangle = self.getRect()
+    other_rectangle = other.getRect()
+    if not rectangle.colliderect(other_rectangle): return False
+    mask = self.animation.getMask(self.frame, self.direction)
+    other_mask = other.animation.getMask(other.frame, other.direction)
+    offset = (other_rectangle.left - rectangle.left,
+              other_rectangle.top - rectangle.top)
+    return mask.overlap(other_mask, offset) is not None
+
+  def draw(self, blend = 1.0):
+    '''
+    Draw the entity in his current state, between his last position and
+    current position (see getPosition).
+    Returns the part of the screen drawn on, or None.
+    '''
+    if self.character.isGone() and self.isAtGoal(): return None
+    surface = self.animation.getFrame(self.frame, self.direction)
+    return pygame.display.get_surface().blit(surface, self.getRect(blend))
 
   # INFORMATION
   
   def isTurnOver(self):
-    if self.nextState in (self.stand, self.run, self.lie, self.fear):
+    if self.nextState <= FEAR:
       if not self.isAtGoal(): return False # try commenting this out for fun
       return True
     return False    
 
   def isThinking(self):
     '''True if this is the entity's turn and no action has started'''
-    return self.nextState == self.wait
+    return self.nextState == WAIT
+
+  def isNPC(self):
+    return self.NPC
 
   def isEscaping(self):
     '''True if the entity is trying to escape but can still be stopped'''
@@ -342,3 +431,8 @@ class Entity:
     whose turns happen before other classes
     '''
     return self.character.isFirst()
+
+# what each state does besides following its RULES
+ACTIONS = (None, Entity.getAway, None, Entity.flee, None, Entity.recoil,
+           Entity.sidestep, Entity.healMyself, None, None, Entity.strike,
+           None, None, Entity.healTarget)
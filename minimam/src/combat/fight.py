@@ -15,43 +15,61 @@
 # You should have received a copy of the GNU General Public License
 # along with Minimam.  If not, see <http://www.gnu.org/licenses/>.
 
+from engine import splitByClass, alternateTurns, isDefeated, sortedTurns
+from engine import Engine, getOutcome, UNDECIDED, STALEMATE
+from engine import ESCAPE, HEAL, ATTACK
 from entity import Entity
+from character.dice import setDice
+from character.party import Party
+from spatial import SpatialIndex
+from timing import FrameTimer, INPUT, THINK, DRAW, FLIP
 from background import Background
 from button import Button
 
 import pygame
 
-def splitByClass(entities):
-  '''Separate Rogues and Dragons from other characters.'''
-  slow, fast = [], []
-  for entity in entities:
-    if entity.isFirst(): fast.append(entity)
-    else:                slow.append(entity)
-  return fast, slow
-
-def alternateTurns(first, second):
-  '''
-  Combine two lists, alternating items from 1st and 2nd list
-  until there are no more items in the one of the lists,
-  with the remaining items from the longer list at the end.
-  '''
-  turns = []
-  for i in range(max(len(first), len(second))):
-    if (i < len(first)):  turns.append(first[i])
-    if (i < len(second)): turns.append(second[i])
-  return turns
-
-def isDefeated(entities):
-  '''True if these entities are all incapacitated or gone'''
-  for entity in entities:
-    if not (entity.isIncapacitated() or entity.isGone()):
-      return False
-  return True
+MAX_TICKS = 5 # most ticks of the fight's clock played between two frames
+MAX_SKIPPED = 4 # most frames in a row skipped when the computer is too slow
+
+# playback modes
+PLAY = 0 # every turn is animated (at Fight.speed)
+SKIP = 1 # NPC actions happen at once, without animating them
+AUTO = 2 # the rules play the whole fight, and only the end is shown
+PLAYBACKS = PLAY, SKIP, AUTO
+
+SPEEDS = 1, 2, 4, 8 # the speeds F5 switches between
 
 class Fight:
   
-  def __init__(self, PCs = [], NPCs = []):
-    self.delay = 30 # duration of animation frames in milliseconds
+  def __init__(self, PCs = [], NPCs = [], log = None, policy = None,
+               prefetcher = None, timer = None, playback = PLAY, speed = 1):
+    '''
+    log records the fights (see combat.log.FightLog).
+    policy chooses the NPCs' actions (see combat.policy),
+    otherwise they choose at random.
+    prefetcher loads the images for the characters in the background
+    (see combat.prefetch).
+    timer times the phases of each frame (see combat.timing.FrameTimer).
+    playback is PLAY, SKIP or AUTO (F6 switches between them),
+    speed is how many times faster than normal the animations play.
+    '''
+    self.delay = 30 # duration of a tick of the fight's clock in milliseconds
+    self.framerate = 60 # most frames drawn per second
+    self.thinking = 0.005 # seconds of each frame the policy may use
+    self.playback = playback
+    self.speed = speed
+    self.tableau = 2000 # milliseconds the end of an AUTO fight is shown
+    self.engine = Engine(log = log, NPC_policy = policy) # the rules
+    self.script = None # decides every action when replaying a fight
+    self.policy = policy
+    self.prefetcher = prefetcher
+    self.timer = timer
+    self.index = SpatialIndex() # finds entities by position
+    self.ranks = {} # which entity is picked when several are under the mouse
+    self.PCs, self.NPCs = [], []
+    self.deciding = False # True while the policy is working on a decision
+    self.redraw = True # draw the whole screen on the next frame
+    self.dirty = [] # parts of the screen drawn on in the last frame
     screen = pygame.display.get_surface()
     self.ring = pygame.rect.Rect(0, 0, 600, 300) # combat circle
     self.ring.centerx = screen.get_width() / 2
@@ -68,25 +86,50 @@ class Fight:
     self.attack = pygame.image.load("graphics/attack.png").convert_alpha()
     
   def setPlayerCharacters(self, PCs):
-    self.PCs = []
+    self.waitForImages(PCs)
+    self.engine.setPlayerCharacters(PCs)
+    for entity in self.PCs:
+      self.index.remove(entity)
+      del self.ranks[entity]
+    entities = []
     for i in range(len(PCs)):
-      self.PCs.append(Entity(PCs[i], i, len(PCs), False, self.ring))
+      entities.append(Entity(PCs[i], i, len(PCs), False, self.ring,
+                             self.engine))
+      self.index.add(entities[i])
+      self.ranks[entities[i]] = 1, i
+    self.PCs = Party(entities, self.engine.PCs.party_index)
   
   def setNonPlayerCharacters(self, NPCs):
-    self.NPCs = []
+    self.waitForImages(NPCs)
+    self.engine.setNonPlayerCharacters(NPCs)
+    for entity in self.NPCs:
+      self.index.remove(entity)
+      del self.ranks[entity]
+    entities = []
     for i in range(len(NPCs)):
-      self.NPCs.append(Entity(NPCs[i], i, len(NPCs), True, self.ring))
+      entities.append(Entity(NPCs[i], i, len(NPCs), True, self.ring,
+                             self.engine))
+      self.index.add(entities[i])
+      self.ranks[entities[i]] = 0, i
+    self.NPCs = Party(entities, self.engine.NPCs.party_index)
+
+  def waitForImages(self, characters):
+    '''Let the prefetcher finish loading the images for these characters.'''
+    if self.prefetcher is None: return
+    self.prefetcher.wait([c.__class__.__name__ for c in characters])
+
+  def getEntity(self, character):
+    '''Find the entity for a character.'''
+    for entity in self.PCs + self.NPCs:
+      if entity.character is character: return entity
+    return None
     
   def sortedEntities(self):
     '''
     Combine the PC and NPC lists
     in the order of the character's turns.
     '''
-    fastPCs,  slowPCs  = splitByClass(self.PCs)
-    fastNPCs, slowNPCs = splitByClass(self.NPCs)
-    fast = alternateTurns(fastPCs, fastNPCs)
-    slow = alternateTurns(slowPCs, slowNPCs)
-    return fast + slow
+    return sortedTurns(self.PCs, self.NPCs)
  
   def toggleFullscreen(self):
     screen = pygame.display.get_surface()
@@ -94,11 +137,27 @@ class Fight:
       pygame.display.set_mode(screen.get_size())
     else:
       pygame.display.set_mode(screen.get_size(), pygame.FULLSCREEN)
+    self.redraw = True
+
+  def toggleTiming(self):
+    '''Show or hide the frame times, timing the frames from now on.'''
+    if self.timer is None: self.timer = FrameTimer()
+    self.timer.toggleOverlay()
+
+  def switchSpeed(self):
+    '''Play the animations at the next of the SPEEDS.'''
+    if self.speed in SPEEDS: i = SPEEDS.index(self.speed) + 1
+    else:                    i = 0
+    self.speed = SPEEDS[i % len(SPEEDS)]
+
+  def switchPlayback(self):
+    '''Change to the next playback mode (from the next turn on).'''
+    self.playback = PLAYBACKS[(self.playback + 1) % len(PLAYBACKS)]
  
   def selectLeft(self):
     '''Select the previous party or option.'''
     if not self.entity.isThinking(): return
-    elif self.entity in self.NPCs: return
+    elif self.entity.isNPC(): return
     elif self.entity.target == None:        self.entity.target = self.NPCs[0]
     elif self.entity.target == self.escape: self.entity.target = None
     elif self.entity.target in self.PCs:    self.entity.target = self.escape
@@ -107,7 +166,7 @@ class Fight:
   def selectRight(self):
     '''Select the next party or option.'''
     if not self.entity.isThinking(): return
-    elif self.entity in self.NPCs: return
+    elif self.entity.isNPC(): return
     elif self.entity.target == None:        self.entity.target = self.escape
     elif self.entity.target == self.escape: self.entity.target = self.PCs[0]
     elif self.entity.target in self.PCs:    self.entity.target = self.NPCs[0]
@@ -116,7 +175,7 @@ class Fight:
   def selectUp(self):
     '''Select the previous character in the party or the previous party.'''
     if not self.entity.isThinking(): return
-    elif self.entity in self.NPCs: return
+    elif self.entity.isNPC(): return
     elif self.entity.target == None:        self.entity.target = self.NPCs[-1]
     elif self.entity.target == self.escape: self.entity.target = None
     elif self.entity.target in self.PCs:
@@ -131,7 +190,7 @@ class Fight:
   def selectDown(self):
     '''Select the next character in the party or the next party.'''
     if not self.entity.isThinking(): return
-    elif self.entity in self.NPCs: return
+    elif self.entity.isNPC(): return
     elif self.entity.target == None:        self.entity.target = self.escape
     elif self.entity.target == self.escape: self.entity.target = self.PCs[0]
     elif self.entity.target in self.PCs:
@@ -146,28 +205,36 @@ class Fight:
   def selectMouse(self):
     '''Select the nearest character under the mouse pointer.'''
     if not self.entity.isThinking(): return
-    elif self.entity in self.NPCs: return
+    elif self.entity.isNPC(): return
     #entity.target = None
-    buttons = [self.escape] + self.NPCs + self.PCs
-    buttons.reverse()
-    for button in buttons:
-      if button.isMouseOver():
-        self.entity.target = button
-        break
+    x, y = pygame.mouse.get_pos()
+    entities = []
+    for entity in self.index.findPoint(x, y):
+      if entity.isSolidAt(x, y): entities.append(entity)
+    if entities: # PCs before NPCs, the last of each party first
+      self.entity.target = max(entities, key = self.ranks.get)
+    elif self.escape.isMouseOver():
+      self.entity.target = self.escape
  
   def chooseAction(self):
     '''Escape, heal or attack the selected target.'''
     if not self.entity.isThinking(): return
-    elif self.entity in self.NPCs: return
-    elif self.entity.target == self.escape: self.entity.fear()
+    elif self.entity.isNPC(): return
+    elif self.script is not None: return
+    elif self.entity.target == self.escape: self.perform(ESCAPE, None)
     elif self.entity.target in self.PCs and self.entity.isHealer():
       if self.entity.target.isInjured() or self.entity.target.isIncapacitated():
-        if self.entity.target == self.entity: self.entity.healSelf()
-        else:                                 self.entity.headToHeal()
+        self.perform(HEAL, self.entity.target)
     elif self.entity.target in self.NPCs:
       if not self.entity.target.isGone():
         if not self.entity.target.isIncapacitated():
-          self.entity.headToAttack()
+          self.perform(ATTACK, self.entity.target)
+
+  def perform(self, action, target):
+    '''Start the action the player chose, and log it (see Engine.choose).'''
+    if target is None: self.engine.choose(self.entity.character, action, None)
+    else: self.engine.choose(self.entity.character, action, target.character)
+    self.entity.performAction(action, target)
 
  
   def input(self):
@@ -178,6 +245,9 @@ class Fight:
       elif event.type == pygame.KEYDOWN:
         if   event.key == pygame.K_ESCAPE: self.quit = True
         elif event.key == pygame.K_F11:    self.toggleFullscreen()
+        elif event.key == pygame.K_F3:     self.toggleTiming()
+        elif event.key == pygame.K_F5:     self.switchSpeed()
+        elif event.key == pygame.K_F6:     self.switchPlayback()
         elif event.key == pygame.K_LEFT:   self.selectLeft()
         elif event.key == pygame.K_RIGHT:  self.selectRight()
         elif event.key == pygame.K_UP:     self.selectUp()
@@ -191,61 +261,221 @@ class Fight:
 
   def think(self):
     '''Entities move and make decisions'''
-    if self.entity.isThinking() and self.entity in self.NPCs:
-      self.entity.randomAction(self.NPCs, self.PCs)
+    if self.entity.isThinking():
+      if self.script is not None:
+        action, target = self.script.getAction()
+        self.entity.performAction(action, self.getEntity(target))
+      elif self.entity.isNPC():
+        self.decide()
     for entity in self.PCs:  entity.move()
     for entity in self.NPCs: entity.move()
 
-  def drawSelector(self):
-    '''Draw a selector under the target if it is a PC or NPC'''
-    if self.entity.target == None: return
-    if self.entity.target == self.escape: return
-    entity_team = self.entity in self.PCs
-    target_team = self.entity.target in self.PCs
+  def decide(self):
+    '''
+    Let the policy think about the NPC's action for part of a frame,
+    and start the action once it has decided.
+    '''
+    if self.policy is None:
+      self.entity.randomAction(self.NPCs, self.PCs)
+      return
+    if not self.deciding:
+      self.policy.start(self.entity.character,
+                        [entity.character for entity in self.NPCs],
+                        [entity.character for entity in self.PCs])
+      self.deciding = True
+    if not self.policy.think(self.thinking): return
+    self.deciding = False
+    action, target = self.policy.getAction()
+    if not self.policy.repeatable:
+      self.engine.choose(self.entity.character, action, target)
+    self.entity.performAction(action, self.getEntity(target))
+
+  def drawSelector(self, blend = 1.0):
+    '''
+    Draw a selector under the target if it is a PC or NPC.
+    Returns the part of the screen drawn on, or None.
+    '''
+    if self.entity.target == None: return None
+    if self.entity.target == self.escape: return None
+    entity_team = not self.entity.isNPC()
+    target_team = not self.entity.target.isNPC()
     if not (entity_team or target_team): selector = self.heal
     elif entity_team and target_team:    selector = self.heal
     else:                                selector = self.attack
     rectangle = selector.get_rect()
-    rectangle.midbottom = self.entity.target.position
+    rectangle.midbottom = self.entity.target.getPosition(blend)
     rectangle.bottom = rectangle.bottom + 15
-    pygame.display.get_surface().blit(selector, rectangle)
-
-  def drawEntities(self):
-    '''Draw the entities representing each character'''
-    entities = self.PCs + self.NPCs
-    entities.sort(lambda a, b: int(a.position[1] - b.position[1]))
-    for entity in entities: entity.draw()
-
-  def draw(self):
-    '''Draw the fight scene'''
-    self.background.draw()
-    self.drawSelector()
-    self.drawEntities()
-    self.escape.draw(self.entity.target == self.escape)
-    pygame.display.flip()
+    return pygame.display.get_surface().blit(selector, rectangle)
+
+  def drawEntities(self, blend = 1.0):
+    '''
+    Draw the entities representing each character.
+    Returns a list of the parts of the screen drawn on (or None).
+    '''
+    entities = self.index.getDrawOrder()
+    return [entity.draw(blend) for entity in entities]
+
+  def draw(self, blend = 1.0):
+    '''
+    Draw the fight scene, blend of the way from the last tick to the
+    current one (see Entity.getPosition). Only the parts of the screen
+    which were drawn on in the last frame or are drawn on in this one
+    are cleared and sent to the display, unless the whole screen needs
+    to be redrawn.
+    '''
+    if self.redraw: self.background.draw()
+    else:
+      for rectangle in self.dirty: self.background.restore(rectangle)
+    drawn = [self.drawSelector(blend)] + self.drawEntities(blend)
+    drawn.append(self.escape.draw(self.entity.target == self.escape))
+    if self.timer is not None:
+      drawn.append(self.timer.draw(budget = 1.0 / self.framerate))
+    drawn = [rectangle for rectangle in drawn if rectangle is not None]
+    if self.timer is not None: self.timer.lap(DRAW)
+    if self.redraw: pygame.display.flip()
+    else:           pygame.display.update(self.dirty + drawn)
+    if self.timer is not None: self.timer.lap(FLIP)
+    self.redraw = False
+    self.dirty = drawn
 
   def turn(self):
-    '''One character's turn'''
+    '''
+    One character's turn. The entities move and decide in ticks of
+    self.delay milliseconds, so the fight takes as long on a slow
+    computer as on a fast one (self.speed times as many ticks are
+    played in the same time). Frames are drawn between ticks (at most
+    self.framerate per second), and when the computer falls behind it
+    plays several ticks and skips frames to catch up.
+    '''
     if self.entity.isIncapacitated() or self.entity.isGone(): return
+    self.engine.beginTurn(self.entity.character)
     self.entity.startTurn()
+    if self.playback == SKIP and self.entity.isNPC():
+      self.skipTurn()
+      return
     self.selectMouse()
+    clock = pygame.time.Clock()
+    last = pygame.time.get_ticks()
+    lag = 0 # milliseconds of ticks waiting to be played
+    skipped = 0
     while True:
-      time = pygame.time.get_ticks()
       if self.quit or self.entity.isTurnOver(): break
+      timer = self.timer # F3 can start timing in the middle of a frame
+      if timer is not None: timer.start()
+      now = pygame.time.get_ticks()
+      lag = min(lag + (now - last) * self.speed,
+                self.delay * MAX_TICKS * self.speed)
+      last = now
+      self.input()
+      if timer is not None: timer.lap(INPUT)
+      ticks = 0
+      while lag >= self.delay and not self.entity.isTurnOver():
+        self.think()
+        lag = lag - self.delay
+        ticks = ticks + 1
+      if timer is not None: timer.lap(THINK)
+      if ticks > self.speed and skipped < MAX_SKIPPED:
+        skipped = skipped + 1
+      else:
+        self.draw(min(lag / float(self.delay), 1.0))
+        skipped = 0
+      if self.prefetcher is not None: self.prefetcher.collect()
+      if timer is not None:
+        timer.lap(THINK)
+        timer.stop()
+      clock.tick(self.framerate)
+
+  def skipTurn(self):
+    '''
+    The rest of an NPC's turn without animation (see SKIP). The ticks
+    are played as fast as the computer can, then everybody still
+    moving is put where he was going and the result is drawn once.
+    '''
+    timer = self.timer
+    if timer is not None: timer.start()
+    self.input()
+    if timer is not None: timer.lap(INPUT)
+    while not (self.quit or self.entity.isTurnOver()): self.think()
+    for entity in self.PCs: entity.settle()
+    for entity in self.NPCs: entity.settle()
+    if timer is not None: timer.lap(THINK)
+    self.draw()
+    if timer is not None: timer.stop()
+
+  def showTableau(self):
+    '''
+    Draw everybody as the fight left them, for self.tableau
+    milliseconds or until the player quits (see AUTO).
+    '''
+    for entity in self.PCs: entity.takePlace()
+    for entity in self.NPCs: entity.takePlace()
+    self.redraw = True
+    clock = pygame.time.Clock()
+    end = pygame.time.get_ticks() + self.tableau
+    while not self.quit and pygame.time.get_ticks() < end:
       self.input()
-      self.think()
       self.draw()
-      elapsed = pygame.time.get_ticks() - time;
-      pygame.time.wait(self.delay - elapsed)
+      clock.tick(self.framerate)
 
   def loop(self):
-    '''Take turns until the PCs or NPCs are defeated'''
+    '''
+    Take turns until the PCs or NPCs are defeated. In AUTO playback
+    the turns are played by the rules alone (with the PCs choosing at
+    random), and a fight which lasts longer than the engine's rounds
+    is a stalemate. When the player quits, the fight is logged as
+    undecided and the log is closed.
+    '''
     entities = self.sortedEntities()
     turn = 0
-    while not self.quit:
-      if isDefeated(self.PCs):  return
-      if isDefeated(self.NPCs): return
+    rounds = 0
+    played = 0 # turns taken, counted like Engine.playRounds does
+    auto = False # True once a turn has been played by the rules alone
+    self.redraw = True
+    self.engine.startFight()
+    while True:
+      outcome = getOutcome(self.PCs, self.NPCs)
+      if outcome == UNDECIDED and auto and rounds >= self.engine.rounds:
+        outcome = STALEMATE
+      if outcome != UNDECIDED or self.quit: break
       self.entity = entities[turn]
-      self.turn()
+      acting = not (self.entity.isIncapacitated() or self.entity.isGone())
+      if self.playback == AUTO:
+        self.engine.turn(self.entity.character)
+        auto = True
+      else:
+        self.turn()
+      # a turn the player quit in the middle of is left out
+      if acting and (self.entity.isTurnOver() or not self.quit):
+        played = played + 1
       turn = turn + 1
-      if turn == len(entities): turn = 0
+      if turn == len(entities):
+        turn = 0
+        rounds = rounds + 1
+    self.engine.endFight(outcome, played)
+    if auto and not self.quit: self.showTableau()
+    if self.quit and self.engine.log is not None: self.engine.log.close()
+
+  def replay(self, engine):
+    '''
+    Show a fight recorded by combat.log.FightLog. The engine is a
+    combat.replay.ReplayEngine, which decides every action and plays it
+    with the dice the fight had.
+    '''
+    rules = self.engine
+    self.engine = self.script = engine
+    self.redraw = True
+    self.setPlayerCharacters(engine.PCs)
+    self.setNonPlayerCharacters(engine.NPCs)
+    previous = setDice(engine.dice)
+    try:
+      while not self.quit:
+        character = engine.getNextActor()
+        if character is None:
+          engine.finish()
+          break
+        self.entity = self.getEntity(character)
+        self.turn()
+    finally:
+      setDice(previous)
+      self.engine = rules
+      self.script = None
@@ -0,0 +1,222 @@
+# Copyright 2008 Seth Galbraith
+#
+# This file is part of Minimam.
+#
+# Minimam is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Minimam is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Minimam.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+A compact record of fights, cheap enough to leave on all the time.
+
+Only what the dice can't decide is written down: who fought, the seed
+of the dice now and then, the choices made by players (and by policies
+which can't be repeated) and how each fight ended. Every turn, roll and
+result follows from those by the rules, so combat.replay plays a fight
+again by repeating it with the same dice. A fight costs a few bytes for
+each character and for each choice, and nothing for the turns between.
+
+The rolls, hits, heals and escapes are not logged, so a log can only be
+replayed by the rules it was made with. START carries VERSION, which
+must be raised whenever the rules of combat or this format change, and
+combat.replay refuses fights from another version instead of playing
+them wrongly. A replay which doesn't end as the log says is reported
+with the number of the fight.
+
+Every event is four bytes: what happened, who did it (the character's
+number, PCs first and then NPCs), who it was done to, and a value.
+Events are collected in memory and written out in large blocks.
+
+  event      actor      target     value
+  DICE       3 bytes of the seed of the dice (SEED_EVENTS in a row)
+  START      VERSION    PCs        policies    (PCs' code * 16 + NPCs')
+  CHARACTER  class      level      0           (PCs first, then NPCs)
+  CHOICE     character  target     action      (see combat.engine)
+  END        turns      turns      outcome     (turns // 256, turns % 256)
+
+The DICE events before a START are the seed of new Dice (spawned from
+the ones in use, see Dice.spawn) which that fight and the ones after it
+are played with. They are written at the start of every block (and when
+the dice change), so each block of a log file can be replayed by itself,
+one fight after the other. Unless the log seeds new dice before every
+fight (checkpoint), the dice must not be used between the fights for
+anything else.
+'''
+
+import struct
+
+from character.dice import SEED_BITS
+from character.warrior import Warrior
+from character.rogue   import Rogue
+from character.wizard  import Wizard
+from character.priest  import Priest
+from character.monster import Monster
+from character.dragon  import Dragon
+
+from policy import RandomPolicy, HeuristicPolicy
+
+VERSION = 1 # of the rules and of this format
+
+DICE      = 1
+START     = 2
+CHARACTER = 3
+CHOICE    = 4
+END       = 5
+
+EVENT_SIZE = 4
+packEvent = struct.Struct("4B").pack
+packEnd = struct.Struct(">BHB").pack # turns in two bytes
+BUFFER_SIZE = 64 * 1024
+SEED_EVENTS = (SEED_BITS + 23) // 24 # three bytes of a seed in each
+
+NOBODY = 255 # the target of a choice without one
+MAX_CHARACTERS = 255 # in a fight, numbered 0 to 254
+MAX_LEVEL = 255
+MAX_TURNS = 65535 # longer fights are logged with this many turns
+
+# The character classes by the number used for them in CHARACTER events.
+CLASSES = Warrior, Rogue, Wizard, Priest, Monster, Dragon
+CLASS_CODES = dict([(CLASSES[i], i) for i in range(len(CLASSES))])
+
+# The CHARACTER event for each class and level, made in advance so that
+# logging a character is just looking it up.
+CHARACTER_EVENTS = {}
+for cls in CLASSES:
+  CHARACTER_EVENTS[cls] = [packEvent(CHARACTER, CLASS_CODES[cls], level, 0)
+                           for level in range(MAX_LEVEL + 1)]
+
+# The policies whose choices come from the dice, by their number in START
+# events (0 is choosing at random without a policy). CHOSEN is any other
+# policy, or a player: each of their choices is logged instead.
+POLICIES = None, RandomPolicy, HeuristicPolicy
+CHOSEN = 15
+
+def getPolicyCode(policy):
+  '''The number for a party's policy in START events.'''
+  if policy is None: return 0
+  if not policy.repeatable: return CHOSEN
+  if policy.__class__ not in POLICIES:
+    raise ValueError("%s can't be logged" % policy.__class__.__name__)
+  return POLICIES.index(policy.__class__)
+
+class FightLog:
+
+  '''Records one or more fights, optionally to a file.'''
+
+  def __init__(self, stream = None, size = BUFFER_SIZE, checkpoint = False):
+    '''
+    stream is a file (opened in binary mode) to write the events to.
+    Without one the events are kept in memory (see getEvents).
+    size is how many bytes are collected before writing them out.
+    checkpoint seeds new dice before every fight, for when the dice
+    are also used between fights. It costs a few bytes a fight.
+    '''
+    self.stream = stream
+    self.size = size
+    self.checkpoint = checkpoint
+    self.buffer = bytearray()
+    self.dice = None # the dice seeded last in this block
+
+  def flush(self):
+    '''Write the collected events to the file, starting a new block.'''
+    if self.stream is None: return
+    self.stream.write(bytes(self.buffer))
+    self.stream.flush()
+    del self.buffer[:]
+    self.dice = None
+
+  def close(self):
+    '''Write the collected events and close the file (if not already).'''
+    if self.stream is None: return
+    self.flush()
+    self.stream.close()
+    self.stream = None
+
+  def getEvents(self):
+    '''The events kept in memory as (event, actor, target, value) tuples.'''
+    return decode(self.buffer)
+
+  # EVENTS (called by combat.engine.Engine)
+  # Nothing is logged during a turn unless somebody chooses an action
+  # without the dice, and the buffer is only written to the file at the
+  # end of a fight.
+
+  def start(self, PCs, NPCs, PC_policy, NPC_policy, dice):
+    '''
+    Log the characters and policies of a fight. Returns the Dice to play
+    it with: these dice, or (if it is time) new ones spawned from them,
+    with their seed logged. Raises ValueError if the fight can't be
+    logged.
+    '''
+    try:
+      characters = "".join([CHARACTER_EVENTS[character.__class__]
+                            [character.level] for character in PCs + NPCs])
+    except (KeyError, IndexError):
+      raise ValueError("only the classes in CLASSES up to level %d "
+                       "can be logged" % MAX_LEVEL)
+    if len(characters) > MAX_CHARACTERS * EVENT_SIZE:
+      raise ValueError("at most %d characters can be logged in a fight" %
+                       MAX_CHARACTERS)
+    if PC_policy is None and NPC_policy is None: policies = 0
+    else: policies = getPolicyCode(PC_policy) * 16 + getPolicyCode(NPC_policy)
+    if dice is not self.dice or self.checkpoint: dice = self.spawnDice(dice)
+    self.buffer += packEvent(START, VERSION, len(PCs), policies) + characters
+    return dice
+
+  def spawnDice(self, dice):
+    '''Spawn new Dice and log their seed. Returns the new Dice.'''
+    dice = dice.spawn(1)[0]
+    for i in range(SEED_EVENTS - 1, -1, -1):
+      value = dice.seed >> (24 * i)
+      self.buffer += packEvent(DICE, value >> 16 & 255, value >> 8 & 255,
+                               value & 255)
+    self.dice = dice
+    return dice
+
+  def choose(self, actor, action, target):
+    '''
+    An action chosen by a player, or by a policy which can't repeat it.
+    The target is None for escaping and doing nothing.
+    '''
+    if target is None: target = NOBODY
+    self.buffer += packEvent(CHOICE, actor, target, action)
+
+  def end(self, outcome, turns):
+    if turns > MAX_TURNS: turns = MAX_TURNS
+    self.buffer += packEnd(END, turns, outcome)
+    if len(self.buffer) >= self.size and self.stream is not None: self.flush()
+
+def decode(data):
+  '''Turn bytes from a log into a list of (event, actor, target, value).'''
+  data = bytearray(data)
+  events = []
+  for i in range(0, len(data) - EVENT_SIZE + 1, EVENT_SIZE):
+    events.append((data[i], data[i + 1], data[i + 2], data[i + 3]))
+  return events
+
+def readEvents(stream):
+  '''Read all the events from a log file (opened in binary mode).'''
+  return decode(stream.read())
+
+def readSeed(events):
+  '''The seed of the dice from SEED_EVENTS DICE events in a row.'''
+  if len(events) != SEED_EVENTS:
+    raise ValueError("a seed is %d DICE events, not %d" %
+                     (SEED_EVENTS, len(events)))
+  seed = 0
+  for kind, first, second, third in events:
+    seed = seed << 24 | first << 16 | second << 8 | third
+  return seed
+
+def getTurns(event):
+  '''The number of turns in an END event.'''
+  return event[1] * 256 + event[2]
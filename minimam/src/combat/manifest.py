@@ -0,0 +1,185 @@
+# Copyright 2008 Seth Galbraith
+#
+# This file is part of Minimam.
+#
+# Minimam is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Minimam is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Minimam.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+A list of exactly which frames of each character animation exist.
+
+For every class, state and direction the manifest says where the frame
+comes from: an image file, the flipped image for the other direction,
+or another state of the same animation (such as heal using the attack
+frame). Loading from the manifest decodes each image file once, without
+trying file names which do not exist.
+
+The manifest is written to graphics/manifest.txt by running
+"python -m combat.manifest" in the src directory (after changing the
+graphics), which also checks it. Without that file the manifest is
+worked out from the names of the files in the graphics directory.
+
+Each line of the file is: class state direction source argument
+where source is "file" or "flip" (argument is an image file name)
+or "same" (argument is the state whose frame is used).
+'''
+
+import os
+import sys
+
+import pygame
+
+from animation import DIRECTIONS, STATES
+
+CLASSNAMES = "warrior", "rogue", "wizard", "priest", "monster", "dragon"
+DIRECTORY = "graphics"
+FILENAME = "manifest.txt"
+
+# states which use another state's frame when they have none of their own
+# (the same substitutions as Animation.getFrame)
+FALLBACKS = {"heal": "attack", "block": "healthy", "pain": "injured"}
+
+class Manifest:
+
+  '''Where the frames of each class come from.'''
+
+  def __init__(self, directory = DIRECTORY):
+    self.directory = directory
+    self.frames = {} # (class, state, direction): (source, argument)
+
+  def scan(self, classnames = CLASSNAMES):
+    '''Work out the manifest from the names of the image files.'''
+    files = dict.fromkeys(os.listdir(self.directory))
+    for classname in classnames:
+      for direction in DIRECTIONS:
+        for state in STATES:
+          filename = "%s-%s-%s.png" % (classname, state, direction)
+          if filename in files:
+            self.frames[classname, state, direction] = "file", filename
+            continue
+          filename = "%s-%s.png" % (classname, state)
+          if filename in files:
+            if direction == "left": source = "flip"
+            else:                   source = "file"
+            self.frames[classname, state, direction] = source, filename
+      for direction in DIRECTIONS:
+        for state, other in FALLBACKS.items():
+          if state not in STATES: continue
+          if (classname, state, direction) in self.frames: continue
+          if (classname, other, direction) not in self.frames: continue
+          self.frames[classname, state, direction] = "same", other
+
+  def read(self):
+    for line in open(os.path.join(self.directory, FILENAME)):
+      fields = line.split()
+      if len(fields) != 5: continue
+      classname, state, direction, source, argument = fields
+      self.frames[classname, state, direction] = source, argument
+
+  def write(self):
+    keys = self.frames.keys()
+    keys.sort()
+    stream = open(os.path.join(self.directory, FILENAME), "w")
+    try:
+      for key in keys:
+        stream.write("%s %s %s %s %s\n" % (key + self.frames[key]))
+    finally:
+      stream.close()
+
+  def hasClass(self, classname):
+    for key in self.frames:
+      if key[0] == classname: return True
+    return False
+
+  def getSource(self, classname, state, direction):
+    '''The (source, argument) of a frame, or None if it has no frame.'''
+    return self.frames.get((classname, state, direction))
+
+  def getFiles(self, classname):
+    '''The image files used by a class (for preloading them).'''
+    files = []
+    for direction in DIRECTIONS:
+      for state in STATES:
+        source = self.getSource(classname, state, direction)
+        if source is None or source[0] == "same": continue
+        if source[1] not in files: files.append(source[1])
+    return files
+
+  def loadFrames(self, classname, images = None):
+    '''
+    Make the frames of a class, decoding each of its image files once.
+    Returns a dictionary of surfaces (not converted to the display
+    format) keyed by (state, direction). images is an optional
+    dictionary of surfaces already decoded from the files, by file name.
+    '''
+    if images is None: images = {}
+    frames = {}
+    for direction in DIRECTIONS:
+      for state in STATES:
+        source = self.getSource(classname, state, direction)
+        if source is None or source[0] == "same": continue
+        kind, filename = source
+        if filename not in images:
+          path = os.path.join(self.directory, filename)
+          images[filename] = pygame.image.load(path)
+        surface = images[filename]
+        if kind == "flip": surface = pygame.transform.flip(surface, True, False)
+        frames[state, direction] = surface
+    for direction in DIRECTIONS:
+      for state in STATES:
+        source = self.getSource(classname, state, direction)
+        if source is None or source[0] != "same": continue
+        frames[state, direction] = frames[source[1], direction]
+    return frames
+
+  def validate(self, classnames = CLASSNAMES):
+    '''Returns a list of problems with the manifest (empty if none).'''
+    problems = []
+    files = dict.fromkeys(os.listdir(self.directory))
+    for key, (source, argument) in self.frames.items():
+      if source in ("file", "flip"):
+        if argument not in files:
+          problems.append("%s %s %s: missing file %s" % (key + (argument,)))
+      elif source == "same":
+        if (key[0], argument, key[2]) not in self.frames:
+          problems.append("%s %s %s: no %s frame" % (key + (argument,)))
+      else:
+        problems.append("%s %s %s: unknown source %s" % (key + (source,)))
+    for classname in classnames:
+      for direction in DIRECTIONS:
+        for state in "healthy", "injured", "incapacitated", "attack":
+          if (classname, state, direction) not in self.frames:
+            problems.append("%s %s %s: no frame" %
+                            (classname, state, direction))
+    return problems
+
+manifest = None
+
+def getManifest(directory = DIRECTORY):
+  '''Load (or work out) the manifest the first time it is needed.'''
+  global manifest
+  if manifest is None:
+    manifest = Manifest(directory)
+    if os.path.exists(os.path.join(directory, FILENAME)): manifest.read()
+    else:                                                manifest.scan()
+  return manifest
+
+if __name__ == "__main__":
+  manifest = Manifest()
+  manifest.scan()
+  problems = manifest.validate()
+  for problem in problems: sys.stderr.write(problem + "\n")
+  if problems: sys.exit(1)
+  manifest.write()
+  sys.stdout.write("wrote %d frames to %s\n" %
+                   (len(manifest.frames), os.path.join(DIRECTORY, FILENAME)))
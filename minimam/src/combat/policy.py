@@ -0,0 +1,267 @@
+# Copyright 2008 Seth Galbraith
+#
+# This file is part of Minimam.
+#
+# Minimam is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Minimam is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Minimam.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Ways for characters (usually the NPCs) to choose their actions.
+
+A policy is asked to decide in small steps, so the animated Fight can
+spread a slow decision over many frames: start a decision, call think
+with a time budget once per frame until it returns True, then getAction.
+choose does all of that at once, for the headless Engine.
+
+RandomPolicy is the original behaviour and HeuristicPolicy follows the
+rules of thumb from experiments/minimam.py. SearchPolicy plays many
+quick imaginary fights (rollouts) from the current position for every
+action it could take and picks the action which does best.
+
+Cost model: a rollout copies the characters and plays at most
+SearchPolicy.depth rounds with the heuristic policy, which takes roughly
+0.15 ms for the parties in game.py on a desktop PC (an OLPC XO-1 is
+about 20 times slower). think never starts a rollout after its budget is
+used up, so a frame's budget is overrun by at most one rollout, and the
+decision is made once the decision budget has been spent in total.
+'''
+
+import math
+import timeit
+
+from character.dice import Dice, getDice, setDice
+from character.traits import getTraits
+from engine import Engine, NOTHING, ESCAPE, HEAL, ATTACK
+from engine import UNDECIDED, WIN, FLEE, LOSS
+from engine import getHealingTargets, getAttackTargets, chooseRandomAction
+from engine import getOutcome
+
+CACHE_SIZE = 1024 # positions remembered by a SearchPolicy
+timer = timeit.default_timer # budgets are a few milliseconds
+
+class Policy:
+
+  '''Base class for policies which decide at once (override decide).'''
+
+  # True if a decision only depends on the position and the current dice,
+  # so combat.log can leave it out and a replay makes it again.
+  repeatable = False
+
+  def start(self, actor, allies, enemies):
+    '''Begin deciding what a character does on his turn.'''
+    self.actor, self.allies, self.enemies = actor, allies, enemies
+    self.action = None
+
+  def think(self, budget):
+    '''
+    Work on the decision for about budget seconds.
+    Returns True once the decision has been made.
+    '''
+    if self.action is None:
+      self.action = self.decide(self.actor, self.allies, self.enemies)
+    return True
+
+  def getAction(self):
+    '''The (action, target) decided on, as in chooseRandomAction.'''
+    return self.action
+
+  def choose(self, actor, allies, enemies):
+    '''Decide without stopping for frames. Returns (action, target).'''
+    return self.decide(actor, allies, enemies)
+
+  def decide(self, actor, allies, enemies):
+    raise NotImplementedError
+
+class RandomPolicy(Policy):
+
+  '''Escape, heal or attack a random target (see chooseRandomAction).'''
+
+  repeatable = True
+
+  def decide(self, actor, allies, enemies):
+    return chooseRandomAction(actor, allies, enemies)
+
+def chooseHeuristicAction(actor, allies, enemies):
+  '''
+  Choose an action with some rules of thumb: weak minions flee when
+  injured, healers heal injured allies who are not escaping, and
+  Wizards and Dragons throw fireballs at healthy enemies who are not
+  escaping. Otherwise attack a random enemy, like chooseRandomAction.
+  '''
+  if actor.isInjured() and actor.getLevel() == 0 and not actor.isHealer():
+    return ESCAPE, None
+  if actor.isHealer():
+    targets = [ally for ally in getHealingTargets(allies) if ally.isInjured()]
+    if len(targets) > 0: return HEAL, getDice().choice(targets)
+  targets = getAttackTargets(enemies)
+  if len(targets) == 0: return NOTHING, None
+  if getTraits(actor).fireball:
+    best = []
+    for enemy in targets:
+      if enemy.isHealthy() and not enemy.isEscaping(): best.append(enemy)
+    if len(best) > 0: return ATTACK, getDice().choice(best)
+  return ATTACK, getDice().choice(targets)
+
+class HeuristicPolicy(Policy):
+
+  '''Follow the rules of thumb in chooseHeuristicAction.'''
+
+  repeatable = True
+
+  def decide(self, actor, allies, enemies):
+    return chooseHeuristicAction(actor, allies, enemies)
+
+def getStrength(party):
+  '''How much fight a party has left, from 0.0 to 1.0.'''
+  if len(party) == 0: return 0.0
+  health = 0
+  for character in party:
+    if not character.isGone(): health = health + character.health
+  return health / (2.0 * len(party))
+
+def evaluate(allies, enemies):
+  '''How good a position is for the allies, from 0.0 (lost) to 1.0 (won).'''
+  outcome = getOutcome(enemies, allies)
+  if outcome == WIN: # the allies were all defeated
+    for ally in allies:
+      if ally.isGone(): return 0.25 # but some of them escaped
+    return 0.0
+  if outcome == LOSS: return 1.0 # the enemies were all incapacitated
+  if outcome == FLEE: return 1.0 # the enemies all ran away
+  return 0.5 + (getStrength(allies) - getStrength(enemies)) / 2.0
+
+def getKey(actor, allies, enemies):
+  '''Something which identifies a position, for remembering results.'''
+  return (allies.index(actor),
+          tuple([(c.__class__, c.level, c.health, c.escape) for c in allies]),
+          tuple([(c.__class__, c.level, c.health, c.escape) for c in enemies]))
+
+class SearchPolicy(Policy):
+
+  '''
+  Monte Carlo search: try each possible action in many rollouts and
+  choose the one with the best average result, spending more rollouts
+  on the promising actions (UCB1). The results for every position are
+  remembered, so when the same position comes up again (on a later turn
+  or in a later fight) the search carries on where it left off.
+  '''
+
+  def __init__(self, budget = 0.25, depth = 4, exploration = 0.7,
+               rollout = None, seed = None):
+    '''
+    budget is how many seconds of thinking go into each decision.
+    depth is how many rounds each rollout plays before it stops and
+    evaluates the position. rollout is the policy the characters follow
+    in rollouts (HeuristicPolicy by default). The rollouts use their own
+    Dice, so thinking never changes the dice rolls of the real fight.
+    '''
+    self.budget = budget
+    self.depth = depth
+    self.exploration = exploration
+    if rollout is None: rollout = HeuristicPolicy()
+    self.rollout = rollout
+    self.dice = Dice(seed)
+    self.table = {}
+    self.rollouts = 0
+
+  def getCandidates(self, actor, allies, enemies):
+    '''
+    Every action the character could take, as (action, side, index)
+    where the target is allies[index] (side 0) or enemies[index] (side 1).
+    '''
+    candidates = []
+    attack_targets = getAttackTargets(enemies)
+    if actor.isHealer():
+      for target in getHealingTargets(allies):
+        candidates.append((HEAL, 0, allies.index(target)))
+    for target in attack_targets:
+      candidates.append((ATTACK, 1, enemies.index(target)))
+    if not actor.isEscaping(): candidates.append((ESCAPE, 0, -1))
+    if len(candidates) == 0: candidates.append((NOTHING, 0, -1))
+    return candidates
+
+  def start(self, actor, allies, enemies):
+    Policy.start(self, actor, allies, enemies)
+    self.spent = 0.0
+    key = getKey(actor, allies, enemies)
+    if key not in self.table:
+      if len(self.table) >= CACHE_SIZE: self.table.clear()
+      stats = []
+      for candidate in self.getCandidates(actor, allies, enemies):
+        stats.append([candidate, 0, 0.0]) # visits and total score
+      self.table[key] = stats
+    self.stats = self.table[key]
+
+  def think(self, budget):
+    if self.action is not None: return True
+    begin = timer()
+    if len(self.stats) > 1:
+      previous = setDice(self.dice)
+      try:
+        while timer() - begin < budget:
+          self.simulate(self.select())
+          if self.spent + timer() - begin >= self.budget: break
+      finally:
+        setDice(previous)
+    self.spent = self.spent + timer() - begin
+    if self.spent >= self.budget or len(self.stats) == 1:
+      self.action = self.getBest()
+      return True
+    return False
+
+  def choose(self, actor, allies, enemies):
+    self.start(actor, allies, enemies)
+    while not self.think(self.budget): pass
+    return self.getAction()
+
+  def select(self):
+    '''The statistics of the candidate to try next (UCB1).'''
+    total = 0
+    for stats in self.stats:
+      if stats[1] == 0: return stats
+      total = total + stats[1]
+    best, best_value = None, -1.0
+    for stats in self.stats:
+      candidate, visits, score = stats
+      value = score / visits + self.exploration * math.sqrt(
+                2.0 * math.log(total) / visits)
+      if value > best_value: best, best_value = stats, value
+    return best
+
+  def simulate(self, stats):
+    '''Play one rollout starting with a candidate and record the result.'''
+    action, side, index = stats[0]
+    allies = [character.copy() for character in self.allies]
+    enemies = [character.copy() for character in self.enemies]
+    actor = allies[self.allies.index(self.actor)]
+    target = None
+    if index >= 0: target = (allies, enemies)[side][index]
+    # the allies play as the NPCs, as they do when the NPCs use a policy
+    engine = Engine(enemies, allies, self.depth, PC_policy = self.rollout,
+                    NPC_policy = self.rollout)
+    engine.perform(actor, action, target)
+    order = engine.sortedCharacters()
+    for character in order[order.index(actor) + 1:]:
+      if engine.getOutcome() != UNDECIDED: break
+      engine.turn(character)
+    if engine.getOutcome() == UNDECIDED: engine.playRounds()
+    stats[1] = stats[1] + 1
+    stats[2] = stats[2] + evaluate(allies, enemies)
+    self.rollouts = self.rollouts + 1
+
+  def getBest(self):
+    '''The (action, target) which has been tried most often.'''
+    best = max(self.stats, key = lambda stats: stats[1])
+    action, side, index = best[0]
+    if index < 0: return action, None
+    return action, (self.allies, self.enemies)[side][index]
@@ -0,0 +1,131 @@
+# Copyright 2008 Seth Galbraith
+#
+# This file is part of Minimam.
+#
+# Minimam is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Minimam is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Minimam.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Decode the images for the next fight while the current one is playing.
+
+Decoding image files is slow, and the first Entity of each class used to
+do it the moment a fight was set up. A Prefetcher decodes the atlas
+(see combat.atlas) or the class's image files (see combat.manifest) on a
+worker thread. Converting them to the display format has to happen on
+the main thread, so Fight calls collect once per frame to finish the
+images that are ready, and wait when it needs a class right away.
+'''
+
+import os
+import threading
+import Queue
+
+from animation import Animation
+from atlas import Atlas, DIRECTORY, INDEX, getAtlas, setAtlas, isAtlasLoaded
+from manifest import getManifest
+from entity import animations
+
+class Prefetcher:
+
+  '''Loads animations on a worker thread (see prefetch and isReady).'''
+
+  def __init__(self, directory = DIRECTORY):
+    self.directory = directory
+    self.requests = Queue.Queue()
+    self.results = Queue.Queue()
+    self.requested = {} # classes asked for, by name ("Warrior" etc.)
+    self.thread = None
+
+  def prefetch(self, classnames):
+    '''Start decoding the images for these classes in the background.'''
+    for classname in classnames:
+      if classname in animations or classname in self.requested: continue
+      self.requested[classname] = True
+      self.requests.put(classname)
+    if self.thread is None and not self.requests.empty():
+      self.thread = threading.Thread(target = self.run)
+      self.thread.setDaemon(True) # don't keep the game open
+      self.thread.start()
+
+  def run(self):
+    '''Decode images on the worker thread, one class at a time.'''
+    try:
+      manifest = getManifest(self.directory)
+    except Exception:
+      manifest = None # only the atlas can be used, the rest fail below
+    atlas = None
+    if isAtlasLoaded():
+      atlas = getAtlas()
+    elif os.path.exists(os.path.join(self.directory, INDEX)):
+      try:
+        atlas = Atlas(self.directory, False)
+        self.results.put(("atlas", atlas))
+      except Exception:
+        atlas = None
+    while True:
+      classname = self.requests.get()
+      try:
+        if atlas is not None and atlas.hasClass(classname.lower()):
+          self.results.put(("atlas class", classname))
+        elif manifest is None:
+          self.results.put(("failed", classname))
+        else:
+          frames = manifest.loadFrames(classname.lower())
+          self.results.put(("frames", (classname, frames)))
+      except Exception:
+        # leave this class for Entity to load the usual way
+        self.results.put(("failed", classname))
+
+  def collect(self, timeout = None):
+    '''
+    Finish the images which the worker thread has decoded.
+    Call this on the main thread (Fight does once per frame).
+    With a timeout, wait up to that many seconds for something to finish.
+    '''
+    block = timeout is not None
+    while True:
+      try:
+        kind, value = self.results.get(block, timeout)
+      except Queue.Empty:
+        return
+      block = False
+      if kind == "atlas":
+        value.convert()
+        if not isAtlasLoaded(): setAtlas(value)
+        continue
+      if kind == "frames": classname, frames = value
+      else:                classname = value
+      del self.requested[classname]
+      if classname in animations: continue
+      if kind == "atlas class":
+        animations[classname] = Animation(classname, getAtlas())
+      elif kind == "frames":
+        animations[classname] = Animation()
+        animations[classname].setFrames(frames)
+
+  def isReady(self, classnames):
+    '''True if Entities of these classes can be made without loading.'''
+    self.collect()
+    for classname in classnames:
+      if classname not in animations: return False
+    return True
+
+  def wait(self, classnames):
+    '''Wait until the images for these classes are ready.'''
+    self.prefetch(classnames)
+    while not self.isReady(classnames):
+      for classname in classnames:
+        if classname in self.requested: break
+      else:
+        return # the worker failed, so Entity will load them itself
+      self.collect(0.1)
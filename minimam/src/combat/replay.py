@@ -0,0 +1,214 @@
+# Copyright 2008 Seth Galbraith
+#
+# This file is part of Minimam.
+#
+# Minimam is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Minimam is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Minimam.  If not, see <http://www.gnu.org/licenses/>.
+
+
+'''
+Play the fights recorded by combat.log.FightLog again.
+
+ReplayEngine is an Engine which plays a logged fight by the rules with
+the same dice, taking the logged choices instead of asking for them, so
+every turn, roll and result comes out as it did. It can replay a fight
+without graphics at full speed (resolve) or be given to Fight.replay to
+watch the fight on screen. Each fight carries on with the dice the one
+before it left (until the log seeds new ones), so replayFights goes
+through a log in order:
+
+  for engine in replayFights(readEvents(open("fights.log", "rb"))):
+    ...
+'''
+
+from character.dice import Dice
+
+from engine import Engine, UNDECIDED, STALEMATE, chooseRandomAction
+import log
+
+def makePolicy(code):
+  '''A policy by its number in START events (see combat.log.POLICIES).'''
+  if code == log.CHOSEN: return None
+  if code >= len(log.POLICIES): raise ValueError("no policy %d" % code)
+  policy = log.POLICIES[code]
+  if policy is None: return None
+  return policy()
+
+class ReplayEngine(Engine):
+
+  '''An Engine which repeats a logged fight.'''
+
+  def __init__(self, events, dice, number = 0):
+    '''
+    events are the (event, actor, target, value) tuples of one fight
+    from combat.log, from its START to its END. dice are the Dice
+    in the state the fight started with. number is the fight's place
+    in the log, for the errors. Raises ValueError if the fight was
+    logged by another version of the rules.
+    '''
+    self.events = events
+    self.position = 0
+    self.number = number
+    kind, version, PC_count, policies = self.next(log.START)
+    if version != log.VERSION:
+      raise ValueError("fight %d was logged by version %d of the rules, "
+                       "this is version %d" % (number, version, log.VERSION))
+    characters = []
+    while self.peek()[0] == log.CHARACTER:
+      kind, classcode, level, value = self.next(log.CHARACTER)
+      if classcode >= len(log.CLASSES):
+        raise ValueError("fight %d has no class %d" % (number, classcode))
+      character = log.CLASSES[classcode]()
+      character.setLevel(level)
+      characters.append(character)
+    Engine.__init__(self, characters[:PC_count], characters[PC_count:],
+                    dice = dice, PC_policy = makePolicy(policies // 16),
+                    NPC_policy = makePolicy(policies % 16))
+    self.characters = characters
+    self.codes = policies // 16, policies % 16
+    end = events[-1]
+    if end[0] != log.END:
+      raise ValueError("fight %d has no END event" % number)
+    self.outcome = end[3]
+    self.turns = log.getTurns(end)
+    self.order = self.sortedCharacters()
+    self.next_turn = 0 # the next character in self.order
+    self.played = 0 # turns played so far
+    self.actor = None # whose turn it is
+    self.finished = False
+
+  def peek(self):
+    '''The next event, without using it up.'''
+    if self.position >= len(self.events): return log.END, 0, 0, UNDECIDED
+    return self.events[self.position]
+
+  def next(self, *kinds):
+    '''Use up the next event, which must be one of these kinds.'''
+    event = self.peek()
+    if event[0] not in kinds:
+      raise ValueError("event %d of fight %d is %r, expected one of %r" %
+                       (self.position, self.number, event, kinds))
+    self.position = self.position + 1
+    return event
+
+  def getNextActor(self):
+    '''
+    The character whose turn is next (in the order of Engine.playRounds),
+    or None when the fight is over.
+    '''
+    self.actor = None
+    while self.getOutcome() == UNDECIDED and self.played < self.turns:
+      character = self.order[self.next_turn]
+      self.next_turn = (self.next_turn + 1) % len(self.order)
+      if character.isIncapacitated() or character.isGone(): continue
+      self.played = self.played + 1
+      self.actor = character
+      break
+    return self.actor
+
+  def getAction(self):
+    '''
+    The (action, target) the current character chose: from the log if
+    it was logged, otherwise made again by his party's policy.
+    '''
+    kind, actor, target, action = self.peek()
+    if kind == log.CHOICE and self.characters[actor] is self.actor:
+      self.position = self.position + 1
+      if target == log.NOBODY: return action, None
+      return action, self.characters[target]
+    if self.isNPC(self.actor): code = self.codes[1]
+    else:                       code = self.codes[0]
+    if code == log.CHOSEN:
+      raise ValueError("event %d of fight %d is %r, expected a choice by "
+                       "character %d" % (self.position, self.number,
+                       self.peek(), self.characters.index(self.actor)))
+    allies = self.getAllies(self.actor)
+    enemies = self.getEnemies(self.actor)
+    policy = self.getPolicy(self.actor)
+    if policy is None: return chooseRandomAction(self.actor, allies, enemies)
+    return policy.choose(self.actor, allies, enemies)
+
+  def turn(self, character):
+    if not self.startTurn(character): return
+    action, target = self.getAction()
+    self.perform(character, action, target)
+
+  def playRounds(self):
+    '''Repeat the turns in the log. Returns the outcome and turn count.'''
+    while True:
+      character = self.getNextActor()
+      if character is None: break
+      self.turn(character)
+    return self.finish()
+
+  def finish(self):
+    '''
+    Make sure the fight ended as the log says.
+    Returns the outcome and the number of turns.
+    '''
+    outcome = self.getOutcome()
+    if outcome == UNDECIDED and self.outcome == STALEMATE:
+      outcome = STALEMATE
+    if self.outcome == UNDECIDED: # the player may have quit after choosing
+      while self.peek()[0] == log.CHOICE: self.position = self.position + 1
+    self.next(log.END)
+    self.finished = True
+    turns = min(self.played, log.MAX_TURNS)
+    if outcome != self.outcome or turns != self.turns:
+      raise ValueError("fight %d ended with outcome %d after %d turns, "
+                       "the log says %d after %d" % (self.number,
+                       outcome, self.played, self.outcome, self.turns))
+    return outcome, self.played
+
+def replayFights(events):
+  '''
+  Go through the fights in a log in order, with a ReplayEngine for each.
+  A fight which hasn't been played (by resolve or Fight.replay) when the
+  next one is wanted is resolved first, because the next one starts
+  with the dice it leaves.
+  '''
+  dice = None
+  seed = [] # DICE events
+  fight = None # the events of the fight so far
+  number = 0 # of the fights so far
+  for event in events:
+    kind = event[0]
+    if kind == log.DICE:
+      seed.append(event)
+      continue
+    if kind == log.START:
+      if seed:
+        dice = Dice(log.readSeed(seed))
+        seed = []
+      if dice is None: raise ValueError("the log doesn't start with dice")
+      fight = []
+    if fight is None: continue
+    fight.append(event)
+    if kind == log.END:
+      engine = ReplayEngine(fight, dice, number)
+      yield engine
+      if not engine.finished: engine.resolve()
+      fight = None
+      number = number + 1
+
+def replay(events):
+  '''
+  Replay every fight in a log without graphics. Returns a list of
+  (ReplayEngine, outcome, turns), with the characters of each
+  ReplayEngine in their final state.
+  '''
+  fights = []
+  for engine in replayFights(events):
+    outcome, turns = engine.resolve()
+    fights.append((engine, outcome, turns))
+  return fights
@@ -0,0 +1,403 @@
+# Copyright 2008 Seth Galbraith
+#
+# This file is part of Minimam.
+#
+# Minimam is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Minimam is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Minimam.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+A server hosting many fights at once, without any graphics.
+
+One process plays every fight on a single asyncore event loop. Each
+connection is a session: the client starts a fight, the NPCs act by
+themselves (choosing at random, like Entity.randomAction) and the
+server waits for the client to choose an action whenever it is a PC's
+turn, the same choices Fight.chooseAction allows.
+
+Messages are JSON objects, one per line. The client sends commands:
+
+  {"command": "start", "PCs": "Priest:1,Rogue:1", "NPCs": "Dragon:2",
+   "seed": 5}                              (parties as in
+                                            simulation.tournament, the
+                                            seed is optional)
+  {"command": "escape"}
+  {"command": "heal", "target": 1}
+  {"command": "attack", "target": 3}
+  {"command": "quit"}
+
+Characters are numbered as in combat.log, the PCs first and then the
+NPCs. After every command the server answers with an update:
+
+  {"events": [[3, 0, 0, 0], ...],          (what happened since the
+                                            last update, see below)
+   "conditions": [[2, 0], ...],            (health and stage of escape
+                                            of every character)
+   "turn": 0,                              (the PC to choose, or null)
+   "heal": [1], "attack": [3, 4],          (the PC's possible targets)
+   "outcome": 0}                           (see combat.engine)
+
+or with {"error": "..."} if the command could not be carried out.
+Every event is four numbers, like the events of combat.log:
+
+  event      actor      target     value
+  START      PCs        NPCs       0           (number of PCs and NPCs)
+  CHARACTER  character  class      level       (class as in combat.log)
+  TURN       character  0          0
+  ESCAPING   character  0          0           (starts escaping)
+  GONE       character  0          0           (finishes escaping)
+  HEALED     character  target     health      (target's health after)
+  HIT        character  target     health      (target's health after)
+  MISS       character  target     0
+  END        0          0          outcome     (see combat.engine)
+
+Each session is limited to MAX_CHARACTERS of level 0 to MAX_LEVEL in
+a party, MAX_MESSAGE bytes in a command and MAX_QUEUED updates the
+client has not read yet, so no client can make the server use much
+memory or hold up the other sessions.
+
+Run it from the src directory: python -m combat.server --help
+'''
+
+import asynchat
+import asyncore
+import json
+import optparse
+import socket
+import sys
+
+from character.dice import Dice, setDice
+from simulation.tournament import parseComposition, createParty
+from engine import Engine, getAttackTargets
+from engine import ESCAPE, HEAL, ATTACK, UNDECIDED, STALEMATE
+from log import CLASS_CODES
+
+PORT = 7007
+MAX_SESSIONS = 1000 # connections served at once
+MAX_CHARACTERS = 32 # in each party
+MAX_LEVEL = 4 # highest level a character can reach
+MAX_MESSAGE = 1024 # bytes in one command
+MAX_QUEUED = 64 # updates waiting to be sent to a client
+BACKLOG = 64 # connections waiting to be accepted
+
+ACTIONS = {"escape": ESCAPE, "heal": HEAL, "attack": ATTACK}
+
+# events in the updates
+START     = 1
+CHARACTER = 2
+TURN      = 3
+ESCAPING  = 4
+GONE      = 5
+HEALED    = 6
+HIT       = 7
+MISS      = 8
+END       = 9
+
+class SessionEngine(Engine):
+
+  '''An Engine which keeps the events of a fight for the updates.'''
+
+  def __init__(self, PCs, NPCs):
+    self.events = []
+    Engine.__init__(self, PCs, NPCs)
+
+  def record(self, kind, actor = None, target = None, value = 0):
+    self.events.append([kind, self.indexes.get(actor, 0),
+                        self.indexes.get(target, 0), value])
+
+  def startFight(self):
+    Engine.startFight(self)
+    self.events.append([START, len(self.PCs), len(self.NPCs), 0])
+    for character in self.PCs + self.NPCs:
+      self.events.append([CHARACTER, self.indexes[character],
+                          CLASS_CODES[character.__class__], character.level])
+
+  def beginTurn(self, character):
+    self.record(TURN, character)
+
+  def escape(self, character):
+    Engine.escape(self, character)
+    self.record(ESCAPING, character)
+
+  def finishEscaping(self, character):
+    Engine.finishEscaping(self, character)
+    self.record(GONE, character)
+
+  def heal(self, character, target):
+    Engine.heal(self, character, target)
+    self.record(HEALED, character, target, target.health)
+
+  def attack(self, character, target):
+    success = Engine.attack(self, character, target)
+    if success: self.record(HIT, character, target, target.health)
+    else:       self.record(MISS, character, target)
+    return success
+
+  def endFight(self, outcome, turns):
+    Engine.endFight(self, outcome, turns)
+    self.record(END, value = outcome)
+
+class Session:
+
+  '''
+  One fight played by a client, without any network code: start it,
+  then choose an action whenever getActor is a PC.
+  '''
+
+  def __init__(self, PCs, NPCs, seed = None):
+    '''PCs and NPCs are lists of Characters.'''
+    self.engine = SessionEngine(PCs, NPCs)
+    self.dice = Dice(seed)
+    self.characters = self.engine.PCs + self.engine.NPCs
+    self.order = self.engine.sortedCharacters()
+    self.turn = 0 # the next character in self.order to act
+    self.rounds = 0
+    self.played = 0 # turns taken
+    self.actor = None # the PC who has to choose an action
+    self.outcome = UNDECIDED
+    self.engine.startFight()
+    self.play()
+
+  def play(self):
+    '''Take turns until a PC has to choose or the fight is over.'''
+    engine = self.engine
+    previous = setDice(self.dice)
+    try:
+      while True:
+        outcome = engine.getOutcome()
+        if outcome == UNDECIDED and self.rounds >= engine.rounds:
+          outcome = STALEMATE
+        if outcome != UNDECIDED:
+          self.outcome = outcome
+          engine.endFight(outcome, self.played)
+          return
+        character = self.order[self.turn]
+        self.turn = self.turn + 1
+        if self.turn == len(self.order):
+          self.turn = 0
+          self.rounds = self.rounds + 1
+        if character.isIncapacitated() or character.isGone(): continue
+        self.played = self.played + 1
+        if character.party is engine.NPCs.party_index:
+          engine.turn(character)
+        elif engine.startTurn(character):
+          self.actor = character
+          return
+    finally:
+      setDice(previous)
+
+  def getActor(self):
+    '''The PC who has to choose an action, or None.'''
+    return self.actor
+
+  def getHealingTargets(self):
+    '''
+    Who the PC may heal: any injured or incapacitated PC, even one who
+    is escaping, as in Fight.chooseAction. (Policies and random choices
+    only heal the PCs in getHealingTargets from combat.engine.)
+    '''
+    if not self.actor.isHealer(): return []
+    return [character for character in self.engine.PCs
+            if character.isInjured() or character.isIncapacitated()]
+
+  def getAttackTargets(self):
+    return getAttackTargets(self.engine.NPCs)
+
+  def choose(self, action, target = None):
+    '''
+    Carry out the PC's action (see combat.engine) against a target
+    Character, and play on. Raises ValueError if it is not allowed.
+    '''
+    if self.actor is None: raise ValueError("it is nobody's turn")
+    if action == HEAL and target not in self.getHealingTargets():
+      raise ValueError("that character can't be healed")
+    if action == ATTACK and target not in self.getAttackTargets():
+      raise ValueError("that character can't be attacked")
+    if action not in (ESCAPE, HEAL, ATTACK):
+      raise ValueError("unknown action: %r" % action)
+    previous = setDice(self.dice)
+    try:
+      self.engine.perform(self.actor, action, target)
+    finally:
+      setDice(previous)
+    self.actor = None
+    self.play()
+
+  def getCharacter(self, number):
+    '''A character by his number in the log.'''
+    if not 0 <= number < len(self.characters):
+      raise ValueError("no character number %r" % number)
+    return self.characters[number]
+
+  def getUpdate(self):
+    '''
+    What has happened since the last update, as a dictionary which can
+    be sent as JSON. The events are only kept until then.
+    '''
+    indexes = self.engine.indexes
+    update = {
+      "events": self.engine.events,
+      "conditions": [(c.health, c.escape) for c in self.characters],
+      "turn": None, "heal": [], "attack": [],
+      "outcome": self.outcome,
+    }
+    self.engine.events = []
+    if self.actor is not None:
+      update["turn"] = indexes[self.actor]
+      update["heal"] = [indexes[c] for c in self.getHealingTargets()]
+      update["attack"] = [indexes[c] for c in self.getAttackTargets()]
+    return update
+
+def checkComposition(composition):
+  '''
+  Make sure a party is small enough and its levels are 0 to MAX_LEVEL
+  before making the characters (a huge level takes ages to set).
+  '''
+  if len(composition) > MAX_CHARACTERS:
+    raise ValueError("at most %d characters in a party" % MAX_CHARACTERS)
+  for classname, level in composition:
+    if not 0 <= level <= MAX_LEVEL:
+      raise ValueError("levels are from 0 to %d" % MAX_LEVEL)
+  return composition
+
+def startSession(message):
+  '''A new Session from a start command.'''
+  PCs = checkComposition(parseComposition(str(message.get("PCs", ""))))
+  NPCs = checkComposition(parseComposition(str(message.get("NPCs", ""))))
+  seed = message.get("seed")
+  if seed is not None and not isinstance(seed, (int, long)):
+    raise ValueError("the seed must be a whole number")
+  return Session(createParty(PCs), createParty(NPCs), seed)
+
+class FightChannel(asynchat.async_chat):
+
+  '''The connection with one client, playing one Session at a time.'''
+
+  def __init__(self, server, connection, map = None):
+    asynchat.async_chat.__init__(self, connection, map)
+    self.set_terminator("\n")
+    self.server = server
+    self.incoming = []
+    self.size = 0 # bytes of the command being received
+    self.session = None
+    server.count = server.count + 1
+
+  def collect_incoming_data(self, data):
+    self.size = self.size + len(data)
+    if self.size <= MAX_MESSAGE: self.incoming.append(data)
+
+  def found_terminator(self):
+    line = "".join(self.incoming)
+    size = self.size
+    self.incoming = []
+    self.size = 0
+    if size > MAX_MESSAGE:
+      self.reply({"error": "commands are at most %d bytes" % MAX_MESSAGE})
+      return
+    try:
+      message = json.loads(line)
+      if not isinstance(message, dict): raise ValueError("not an object")
+      self.respond(message)
+    except ValueError as error:
+      self.reply({"error": str(error)})
+
+  def respond(self, message):
+    '''Carry out a command and send the update.'''
+    command = message.get("command")
+    if not isinstance(command, basestring):
+      raise ValueError("the command must be a string")
+    if command == "quit":
+      self.close_when_done()
+      return
+    if command == "start":
+      self.session = startSession(message)
+    elif command in ACTIONS:
+      if self.session is None: raise ValueError("no fight has started")
+      target = message.get("target")
+      if target is not None:
+        if not isinstance(target, (int, long)):
+          raise ValueError("the target must be a character number")
+        target = self.session.getCharacter(target)
+      self.session.choose(ACTIONS[command], target)
+    else:
+      raise ValueError("unknown command: %r" % command)
+    self.reply(self.session.getUpdate())
+
+  def reply(self, message):
+    '''
+    Send a message, unless the client has stopped reading them:
+    then the connection is closed instead of keeping them all.
+    '''
+    if len(self.producer_fifo) >= MAX_QUEUED:
+      self.close()
+      return
+    self.push(json.dumps(message, separators = (",", ":")) + "\n")
+
+  def close(self):
+    if self.server is not None:
+      self.server.count = self.server.count - 1
+      self.server = None
+    asynchat.async_chat.close(self)
+
+class FightServer(asyncore.dispatcher):
+
+  '''Accepts connections and gives each one a FightChannel.'''
+
+  def __init__(self, host = "localhost", port = PORT,
+               sessions = MAX_SESSIONS, map = None):
+    '''
+    port 0 picks any free port (see getAddress).
+    sessions is how many connections are served at once.
+    map is the asyncore socket map to use, asyncore's own by default.
+    '''
+    asyncore.dispatcher.__init__(self, map = map)
+    self.sessions = sessions
+    self.count = 0 # connections open
+    self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+    self.set_reuse_addr()
+    self.bind((host, port))
+    self.listen(BACKLOG)
+
+  def getAddress(self):
+    return self.socket.getsockname()
+
+  def handle_accept(self):
+    pair = self.accept()
+    if pair is None: return
+    connection, address = pair
+    if self.count >= self.sessions:
+      connection.close()
+      return
+    FightChannel(self, connection, self._map)
+
+def main(arguments = None):
+  parser = optparse.OptionParser(
+    usage = "%prog [options]",
+    description = "Host fights for clients connecting over TCP, with "
+                  "JSON commands and updates one per line (see the "
+                  "combat.server module for the messages).")
+  parser.add_option("-H", "--host", default = "localhost",
+                    help = "address to listen on [%default]")
+  parser.add_option("-p", "--port", type = "int", default = PORT,
+                    help = "port to listen on [%default]")
+  parser.add_option("-s", "--sessions", type = "int", default = MAX_SESSIONS,
+                    help = "most clients connected at once [%default]")
+  options, arguments = parser.parse_args(arguments)
+  server = FightServer(options.host, options.port, options.sessions)
+  sys.stderr.write("serving fights on %s:%d\n" % server.getAddress())
+  try:
+    asyncore.loop(use_poll = True) # select is limited to 1024 sockets
+  except KeyboardInterrupt:
+    pass
+
+if __name__ == "__main__":
+  main()
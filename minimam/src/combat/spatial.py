@@ -0,0 +1,134 @@
+# Copyright 2008 Seth Galbraith
+#
+# This file is part of Minimam.
+#
+# Minimam is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Minimam is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Minimam.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Find entities by position without looking at every one of them.
+
+The screen is divided into square cells and each entity is listed in
+the cells its rectangle covers, so finding what is under the mouse only
+looks at the entities in one cell. The entities are also kept sorted by
+how far down the screen they stand, which is the order to draw them in.
+Entity.move updates the index whenever an entity moves or changes frame.
+'''
+
+import bisect
+
+CELL_SIZE = 128 # width and height of a cell in pixels
+
+class SpatialIndex:
+
+  '''A grid of cells listing the entities whose rectangles cover them.'''
+
+  def __init__(self, size = CELL_SIZE):
+    self.size = size
+    self.cells = {} # (column, row): {entity: True}
+    self.rects = {} # entity: rectangle
+    self.bounds = {} # entity: first and last (column, row) it covers
+    self.states = {} # entity: position, frame and direction when updated
+    self.keys = {} # entity: (y, number) for the draw order
+    self.order = [] # sorted (y, number, entity)
+    self.count = 0
+
+  def getBounds(self, rectangle):
+    '''The first and last column and row of the cells a rectangle covers.'''
+    size = self.size
+    return (rectangle.left // size, rectangle.top // size,
+            (rectangle.right - 1) // size, (rectangle.bottom - 1) // size)
+
+  def getCells(self, bounds):
+    left, top, right, bottom = bounds
+    return [(column, row) for column in range(left, right + 1)
+                          for row in range(top, bottom + 1)]
+
+  def file(self, entity, bounds):
+    '''List an entity in the cells within these bounds.'''
+    self.bounds[entity] = bounds
+    for cell in self.getCells(bounds):
+      self.cells.setdefault(cell, {})[entity] = True
+
+  def unfile(self, entity):
+    '''Take an entity out of the cells it is listed in.'''
+    for cell in self.getCells(self.bounds.pop(entity)):
+      del self.cells[cell][entity]
+      if not self.cells[cell]: del self.cells[cell]
+
+  def refile(self, entity, bounds):
+    '''Change only the cells which an entity has entered or left.'''
+    old = dict.fromkeys(self.getCells(self.bounds[entity]))
+    new = dict.fromkeys(self.getCells(bounds))
+    for cell in old:
+      if cell in new: continue
+      del self.cells[cell][entity]
+      if not self.cells[cell]: del self.cells[cell]
+    for cell in new:
+      if cell not in old: self.cells.setdefault(cell, {})[entity] = True
+    self.bounds[entity] = bounds
+
+  def add(self, entity):
+    '''Start keeping track of an entity (see Entity.index).'''
+    self.count = self.count + 1
+    self.keys[entity] = (entity.position[1], self.count)
+    bisect.insort(self.order, self.keys[entity] + (entity,))
+    self.rects[entity] = rectangle = entity.getRect()
+    self.states[entity] = entity.position, entity.frame, entity.direction
+    self.file(entity, self.getBounds(rectangle))
+    entity.index = self
+
+  def remove(self, entity):
+    self.unfile(entity)
+    del self.rects[entity]
+    del self.states[entity]
+    key = self.keys.pop(entity)
+    del self.order[bisect.bisect_left(self.order, key)]
+    entity.index = None
+
+  def clear(self):
+    for entity in self.rects.keys(): self.remove(entity)
+
+  def update(self, entity):
+    '''Move an entity to its current cells and place in the draw order.'''
+    state = entity.position, entity.frame, entity.direction
+    if state == self.states[entity]: return # nothing has changed
+    self.states[entity] = state
+    rectangle = entity.getRect()
+    if rectangle != self.rects[entity]:
+      self.rects[entity] = rectangle
+      bounds = self.getBounds(rectangle)
+      if bounds != self.bounds[entity]: self.refile(entity, bounds)
+    key = self.keys[entity]
+    if entity.position[1] != key[0]:
+      del self.order[bisect.bisect_left(self.order, key)]
+      key = self.keys[entity] = entity.position[1], key[1]
+      bisect.insort(self.order, key + (entity,))
+
+  def findPoint(self, x, y):
+    '''The entities whose rectangles contain a point.'''
+    cell = self.cells.get((x // self.size, y // self.size), ())
+    return [entity for entity in cell
+            if self.rects[entity].collidepoint(x, y)]
+
+  def findRect(self, rectangle):
+    '''The entities whose rectangles overlap a rectangle.'''
+    found = {}
+    for cell in self.getCells(self.getBounds(rectangle)):
+      for entity in self.cells.get(cell, ()):
+        if self.rects[entity].colliderect(rectangle): found[entity] = True
+    return found.keys()
+
+  def getDrawOrder(self):
+    '''All the entities, from the top of the screen to the bottom.'''
+    return [item[2] for item in self.order]
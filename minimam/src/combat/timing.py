@@ -0,0 +1,152 @@
+# Copyright 2008 Seth Galbraith
+#
+# This file is part of Minimam.
+#
+# Minimam is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Minimam is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Minimam.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+How long each part of a frame takes, for finding what makes the game slow.
+
+A FrameTimer is given to Fight, which marks the end of each phase of a
+frame: handling input, thinking (the ticks of the fight's clock and
+collecting prefetched images), drawing and flipping (sending the frame
+to the display). Time spent waiting for the next frame is left out. The times of the last
+SIZE frames are kept in a ring buffer. The Fight can show them in an
+overlay (press F3) and they can be written to a CSV file. Without a
+FrameTimer the Fight only checks for one None each phase.
+'''
+
+import array
+import csv
+import timeit
+
+import pygame
+
+INPUT = 0
+THINK = 1
+DRAW  = 2
+FLIP  = 3
+
+PHASES = "input", "think", "draw", "flip"
+COLORS = (0, 160, 255), (0, 200, 0), (255, 160, 0), (220, 0, 0)
+
+SIZE = 1024 # frames kept
+
+GRAPH_SIZE = 256, 100 # size of the overlay's graph in pixels
+SCALE = 2 # pixels in the graph for each millisecond
+
+timer = timeit.default_timer # the most precise clock on each platform
+
+def getPercentile(times, percent):
+  '''The time which percent of these times are no longer than.'''
+  if not times: return 0.0
+  times = sorted(times)
+  return times[min(len(times) - 1, int(len(times) * percent / 100.0))]
+
+class FrameTimer:
+
+  '''Times the phases of frames and keeps the last few in a ring buffer.'''
+
+  def __init__(self, size = SIZE):
+    self.size = size
+    # seconds spent in each phase of each frame, one array for each phase
+    self.times = [array.array("d", [0.0]) * size for phase in PHASES]
+    self.position = 0 # where the next frame goes in the arrays
+    self.count = 0 # number of frames timed (including those overwritten)
+    self.overlay = False # show the overlay
+    self.font = None
+    self.last = timer()
+
+  def start(self):
+    '''Begin timing a frame.'''
+    for times in self.times: times[self.position] = 0.0
+    self.last = timer()
+
+  def lap(self, phase):
+    '''Add the time since the last lap (or the start) to a phase.'''
+    now = timer()
+    self.times[phase][self.position] += now - self.last
+    self.last = now
+
+  def stop(self):
+    '''Finish timing a frame.'''
+    self.position = (self.position + 1) % self.size
+    self.count = self.count + 1
+
+  def toggleOverlay(self):
+    self.overlay = not self.overlay
+
+  def getFrames(self):
+    '''
+    The timed frames still in the buffer, oldest first, as lists of
+    (frame number, seconds for each phase...).
+    '''
+    kept = min(self.count, self.size)
+    frames = []
+    for i in range(kept):
+      position = (self.position - kept + i) % self.size
+      frames.append([self.count - kept + i] +
+                    [times[position] for times in self.times])
+    return frames
+
+  def getTotals(self):
+    '''The total seconds of each frame still in the buffer, oldest first.'''
+    return [sum(frame[1:]) for frame in self.getFrames()]
+
+  def writeCSV(self, stream):
+    '''Write the frames in the buffer to a file, in milliseconds.'''
+    writer = csv.writer(stream)
+    writer.writerow(("frame",) + PHASES + ("total",))
+    for frame in self.getFrames():
+      times = frame[1:]
+      writer.writerow([frame[0]] + ["%.3f" % (t * 1000) for t in times] +
+                      ["%.3f" % (sum(times) * 1000)])
+
+  def draw(self, position = (10, 10), budget = None):
+    '''
+    Draw the overlay: a bar for each of the latest frames with the
+    time of each phase stacked in its color, a line at the budget
+    (the seconds a frame may take), and the median (p50) and 99th
+    percentile (p99) frame times. Returns the part of the screen drawn
+    on, or None if the overlay is hidden.
+    '''
+    if not self.overlay: return None
+    screen = pygame.display.get_surface()
+    width, height = GRAPH_SIZE
+    rectangle = pygame.Rect(position, (width, height + 20))
+    screen.fill((0, 0, 0), rectangle)
+    frames = min(self.count, self.size, width // 2)
+    bottom = rectangle.top + height
+    for i in range(frames):
+      position = (self.position - frames + i) % self.size
+      x = rectangle.left + i * 2
+      y = bottom
+      for phase in range(len(PHASES)):
+        size = int(self.times[phase][position] * 1000 * SCALE)
+        if size <= 0: continue
+        top = max(y - size, rectangle.top)
+        pygame.draw.line(screen, COLORS[phase], (x, y), (x, top), 2)
+        y = top
+    if budget is not None:
+      y = max(bottom - int(budget * 1000 * SCALE), rectangle.top)
+      pygame.draw.line(screen, (255, 255, 255), (rectangle.left, y),
+                       (rectangle.right - 1, y))
+    if pygame.font and pygame.font.get_init():
+      if self.font is None: self.font = pygame.font.Font(None, 18)
+      totals = self.getTotals()
+      text = "p50 %.1f ms  p99 %.1f ms" % (getPercentile(totals, 50) * 1000,
+                                           getPercentile(totals, 99) * 1000)
+      label = self.font.render(text, True, (255, 255, 255))
+      screen.blit(label, (rectangle.left + 4, bottom + 3))
+    return rectangle
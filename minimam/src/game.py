@@ -16,6 +16,20 @@
 # along with Minimam.  If not, see <http://www.gnu.org/licenses/>.
 
 
+# the screen sizes to try, best first (also used by benchmark.render)
+RESOLUTIONS = [
+  (1680, 1050), # WSXGA+
+  (1600, 1200), # UXGA
+  (1440, 900),  # ulrich's laptop
+  (1400, 1050), # SXGA+
+  (1280, 1024), # WXGA
+  (1280, 800),  # my laptop
+  (1200, 900),  # OLPC XO-1
+  (1024, 768),  # XGA
+  (800, 600),   # SVGA
+  (800, 480),   # WVGA (Eee PC, CloudBook)
+  (640, 480)]   # VGA
+
 # To-do implement the exploration part of the game
 # the following code is already in combat/fight.py
 # and should be removed as soon as we have something else here
@@ -29,23 +43,32 @@ if __name__ == "__main__":
   from character.monster import Monster
   from character.dragon  import Dragon
   
-  from combat.fight import Fight
+  from character.dice import getDice
+  from combat.fight import Fight, PLAY, SKIP, AUTO
+  from combat.log import FightLog
+  from combat.prefetch import Prefetcher
+  from combat.timing import FrameTimer
   
+  import optparse
   import pygame
-  import random
   
-  RESOLUTIONS = [
-    (1680, 1050), # WSXGA+
-    (1600, 1200), # UXGA
-    (1440, 900),  # ulrich's laptop
-    (1400, 1050), # SXGA+
-    (1280, 1024), # WXGA
-    (1280, 800),  # my laptop
-    (1200, 900),  # OLPC XO-1
-    (1024, 768),  # XGA
-    (800, 600),   # SVGA
-    (800, 480),   # WVGA (Eee PC, CloudBook)
-    (640, 480)]   # VGA
+  parser = optparse.OptionParser(
+    usage = "%prog [options] [times.csv]",
+    description = "Watch fights between randomly chosen parties. With a "
+                  "file name, the times of the last frames (see F3) are "
+                  "written to it when the game ends.")
+  parser.add_option("-s", "--speed", type = "int", default = 1,
+                    help = "how many times faster the fights play [%default]")
+  parser.add_option("-p", "--playback", default = "play",
+                    choices = ["play", "skip", "auto"],
+                    help = "play every turn, skip the NPCs' animations or "
+                           "only show the end of each fight [%default]")
+  parser.add_option("-l", "--log", default = "fights.log",
+                    help = "file the fights are added to, to replay them "
+                           "with combat.replay [%default]")
+  options, arguments = parser.parse_args()
+  if options.speed < 1: parser.error("the speed must be at least 1")
+  playback = {"play": PLAY, "skip": SKIP, "auto": AUTO}[options.playback]
   
   pygame.init()
   for resolution in RESOLUTIONS:
@@ -54,9 +77,9 @@ if __name__ == "__main__":
       break
   pygame.mouse.set_visible(True)
   
-  fight = Fight()
-  while not fight.quit:
-    choice = random.randrange(3)
+  def chooseMatchup():
+    '''Choose the PCs and NPCs for the next fight.'''
+    choice = getDice().randrange(3)
     if choice == 0:
       PCs = [Warrior(), Warrior(), Warrior()]
       NPCs = [Rogue(), Rogue(), Rogue(), Rogue()]
@@ -68,6 +91,27 @@ if __name__ == "__main__":
       for character in PCs: character.setLevel(1)
       NPCs = [Monster(), Monster(), Dragon(), Monster(), Monster()]
       NPCs[2].setLevel(2)
+    # load the images while the fight before this one is playing
+    prefetcher.prefetch([c.__class__.__name__ for c in PCs + NPCs])
+    return PCs, NPCs
+
+  # "python game.py times.csv" writes the latest frame times to a file
+  timer = None
+  if arguments: timer = FrameTimer()
+  prefetcher = Prefetcher()
+  # chooseMatchup rolls the dice between fights, so the log seeds new
+  # dice for every fight
+  log = FightLog(open(options.log, "ab"), checkpoint = True)
+  PCs, NPCs = chooseMatchup()
+  fight = Fight(prefetcher = prefetcher, timer = timer, playback = playback,
+                speed = options.speed, log = log)
+  while not fight.quit:
     fight.setPlayerCharacters(PCs)
     fight.setNonPlayerCharacters(NPCs)
+    PCs, NPCs = chooseMatchup()
     fight.loop()
+  log.close()
+  if timer is not None:
+    stream = open(arguments[0], "wb")
+    timer.writeCSV(stream)
+    stream.close()
@@ -0,0 +1,208 @@
+# Copyright 2008 Seth Galbraith
+#
+# This file is part of Minimam.
+#
+# Minimam is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Minimam is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Minimam.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Simulate many independent fights between the same two parties at once.
+
+Every character is a column and every fight is a row of NumPy arrays,
+so each turn slot is played for all the fights with a few array operations.
+The rules are the same as combat.engine.Engine with random actions.
+'''
+
+import numpy
+
+from character.character import HEALTHY, INJURED, INCAPACITATED
+from character.character import STAYING, LEAVING, GONE
+from character.dice import Dice
+from character.odds import HIT_CHANCES, MAX_DIFFERENCE
+from character.traits import getTraits
+from combat.engine import sortedTurns
+from combat.engine import UNDECIDED, WIN, FLEE, LOSS, STALEMATE
+
+class BatchResult:
+
+  '''
+  The results of a batch of fights, one row per fight.
+  outcomes: how each fight ended (WIN, FLEE, LOSS or STALEMATE)
+  turns:    the number of turns taken in each fight
+  health:   the final health of each character (PCs first, then NPCs)
+  escape:   the final escape stage of each character
+  '''
+
+  def __init__(self, outcomes, turns, health, escape, PCs):
+    self.outcomes = outcomes
+    self.turns = turns
+    self.health = health
+    self.escape = escape
+    self.PCs = PCs
+
+  def __len__(self):
+    return len(self.outcomes)
+
+  def getRate(self, outcome):
+    '''The fraction of the fights which ended with this outcome.'''
+    return numpy.mean(self.outcomes == outcome)
+
+  def getWinRate(self):
+    return self.getRate(WIN)
+
+  def getSurvivors(self, NPC = False):
+    '''
+    The number of characters in a party which are still standing
+    (not incapacitated and not gone) at the end of each fight.
+    '''
+    if NPC: columns = slice(self.PCs, None)
+    else:   columns = slice(0, self.PCs)
+    standing = ((self.health[:, columns] != INCAPACITATED) &
+                (self.escape[:, columns] != GONE))
+    return standing.sum(1)
+
+  def getSurvivorCounts(self, NPC = False):
+    '''How many fights ended with 0, 1, 2... survivors in a party.'''
+    if NPC: size = self.health.shape[1] - self.PCs
+    else:   size = self.PCs
+    return numpy.bincount(self.getSurvivors(NPC), minlength = size + 1)
+
+class Batch:
+
+  '''A matchup between two parties which can be simulated many times.'''
+
+  def __init__(self, PCs, NPCs, rounds = 1000, seed = None):
+    '''
+    PCs and NPCs are lists of Characters which serve as templates:
+    only their class and level matter, not their current condition.
+    seed can be a number or Dice (see character.dice) to seed NumPy with.
+    '''
+    self.rounds = rounds
+    if isinstance(seed, Dice): seed = seed.randrange(2 ** 32)
+    self.random = numpy.random.RandomState(seed)
+    characters = list(PCs) + list(NPCs)
+    columns = {}
+    for i in range(len(characters)): columns[id(characters[i])] = i
+    self.order = [columns[id(c)] for c in sortedTurns(PCs, NPCs)]
+    self.PCs = len(PCs)
+    traits = [getTraits(c) for c in characters]
+    self.level = numpy.array([t.level for t in traits])
+    self.healer = [t.healer for t in traits]
+    self.fireball = [t.fireball for t in traits]
+    self.attack_bonus = numpy.array([t.attack_bonus for t in traits])
+    self.escaping_attack_bonus = numpy.array(
+      [t.escaping_attack_bonus - t.attack_bonus for t in traits])
+    self.defense_bonus = numpy.array([t.defense_bonus for t in traits])
+    self.escaping_defense_bonus = numpy.array(
+      [t.escaping_defense_bonus - t.defense_bonus for t in traits])
+    self.hit_chances = numpy.array(HIT_CHANCES)
+    self.NPC = numpy.zeros(len(characters), bool)
+    self.NPC[self.PCs:] = True
+
+  def pick(self, rows, candidates):
+    '''
+    Pick one random candidate column in each of these rows
+    (like random.choice). Rows without candidates get -1.
+    '''
+    counts = candidates.sum(1)
+    chosen = numpy.floor(self.random.random_sample(len(rows)) * counts)
+    running = numpy.cumsum(candidates, 1)
+    picks = numpy.argmax(running > chosen[:, numpy.newaxis], 1)
+    picks[counts == 0] = -1
+    return picks
+
+  def heal(self, health, rows, columns):
+    '''Heal one character in each row: incapacitated to injured to healthy.'''
+    health[rows, columns] = numpy.minimum(health[rows, columns] + 1, HEALTHY)
+
+  def attack(self, health, escape, rows, attacker, targets):
+    '''
+    One character attacks a target in each of these rows.
+    Each attack is decided by one random number (see character.odds).
+    '''
+    escaping = escape[rows, targets] == LEAVING
+    attack = (self.level[attacker] + self.attack_bonus[attacker] +
+              self.escaping_attack_bonus[attacker] * escaping)
+    defense = (self.level[targets] + self.defense_bonus[targets] +
+               self.escaping_defense_bonus[targets] * escaping)
+    difference = numpy.clip(attack - defense, -MAX_DIFFERENCE, MAX_DIFFERENCE)
+    chances = self.hit_chances[difference + MAX_DIFFERENCE]
+    hit = self.random.random_sample(len(rows)) < chances
+    rows, targets = rows[hit], targets[hit]
+    escape[rows, targets] = STAYING
+    if self.fireball[attacker]: health[rows, targets] = INCAPACITATED
+    else:                       health[rows, targets] -= 1
+
+  def turn(self, health, escape, rows, column):
+    '''
+    The character in this column takes his turn in each of these rows.
+    Rows must be undecided fights in which the character can act.
+    '''
+    leaving = escape[rows, column] == LEAVING
+    escape[rows[leaving], column] = GONE
+    rows = rows[~leaving]
+    injured = health[rows, column] == INJURED
+    if self.healer[column]: health[rows[injured], column] = HEALTHY
+    else:                   escape[rows[injured], column] = LEAVING
+    rows = rows[~injured]
+    allies = self.NPC == self.NPC[column]
+    if self.healer[column]:
+      candidates = ((health[rows] != HEALTHY) &
+                    (escape[rows] == STAYING) & allies)
+      targets = self.pick(rows, candidates)
+      healing = targets >= 0
+      self.heal(health, rows[healing], targets[healing])
+      rows = rows[~healing]
+    candidates = ((health[rows] != INCAPACITATED) &
+                  (escape[rows] != GONE) & ~allies)
+    targets = self.pick(rows, candidates)
+    attacking = targets >= 0
+    self.attack(health, escape, rows[attacking], column, targets[attacking])
+
+  def getOutcomes(self, health, escape):
+    '''Like combat.engine.getOutcome for every row at once.'''
+    down = (health == INCAPACITATED) | (escape == GONE)
+    PCs_defeated = down[:, :self.PCs].all(1)
+    NPCs_defeated = down[:, self.PCs:].all(1)
+    PCs_fled = (escape[:, :self.PCs] == GONE).any(1)
+    outcomes = numpy.zeros(len(health), numpy.int8)
+    outcomes[NPCs_defeated] = WIN
+    outcomes[PCs_defeated & PCs_fled] = FLEE
+    outcomes[PCs_defeated & ~PCs_fled] = LOSS
+    return outcomes
+
+  def run(self, fights):
+    '''Simulate this many fights and return a BatchResult.'''
+    size = len(self.level)
+    health = numpy.empty((fights, size), numpy.int8)
+    health.fill(HEALTHY)
+    escape = numpy.empty((fights, size), numpy.int8)
+    escape.fill(STAYING)
+    turns = numpy.zeros(fights, numpy.int32)
+    outcomes = self.getOutcomes(health, escape)
+    undecided = numpy.nonzero(outcomes == UNDECIDED)[0]
+    for i in range(self.rounds):
+      if len(undecided) == 0: break
+      for column in self.order:
+        rows = undecided[(health[undecided, column] != INCAPACITATED) &
+                         (escape[undecided, column] != GONE)]
+        turns[rows] += 1
+        self.turn(health, escape, rows, column)
+        outcomes[rows] = self.getOutcomes(health[rows], escape[rows])
+        undecided = undecided[outcomes[undecided] == UNDECIDED]
+    outcomes[undecided] = STALEMATE
+    return BatchResult(outcomes, turns, health, escape, self.PCs)
+
+def simulate(PCs, NPCs, fights, rounds = 1000, seed = None):
+  '''Simulate many fights between these parties and return a BatchResult.'''
+  return Batch(PCs, NPCs, rounds, seed).run(fights)
@@ -0,0 +1,292 @@
+# Copyright 2008 Seth Galbraith
+#
+# This file is part of Minimam.
+#
+# Minimam is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Minimam is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Minimam.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Calculate the chances of winning a fight instead of simulating it.
+
+A fight where everybody chooses random actions (combat.engine.Engine)
+is a Markov chain: the state is whose turn it is plus the health and
+escape stage of every character. The Solver finds every reachable state,
+remembers the chance of moving from each state to the next, and then
+works backwards from the finished fights to the chance of each outcome.
+'''
+
+from character.character import HEALTHY, INJURED, INCAPACITATED
+from character.character import STAYING, LEAVING, GONE
+from character.odds import getHitChance
+from character.traits import getTraits
+from combat.engine import sortedTurns
+from combat.engine import UNDECIDED, WIN, FLEE, LOSS, STALEMATE
+
+class StateSpaceTooLarge(Exception):
+  '''Raised when a fight has more states than the Solver is allowed.'''
+  pass
+
+class Solver:
+
+  '''Finds the exact chances of each outcome of a fight between two parties.'''
+
+  def __init__(self, PCs, NPCs, limit = 1000000):
+    '''
+    PCs and NPCs are lists of Characters which serve as templates:
+    only their class and level matter, not their current condition.
+    limit is the largest number of states the solver will explore.
+    '''
+    self.limit = limit
+    characters = list(PCs) + list(NPCs)
+    columns = {}
+    for i in range(len(characters)): columns[id(characters[i])] = i
+    self.order = [columns[id(c)] for c in sortedTurns(PCs, NPCs)]
+    self.PCs = len(PCs)
+    self.traits = [getTraits(c) for c in characters]
+    self.transitions = {}
+    self.outcomes = None
+
+  # STATES
+  # A state is a tuple of the turn (an index into self.order) followed by
+  # (health, escape) pairs for each character, PCs first and then NPCs.
+
+  def getStart(self):
+    return (0,) + ((HEALTHY, STAYING),) * len(self.traits)
+
+  def getOutcome(self, state):
+    '''Like combat.engine.getOutcome for a state.'''
+    PCs = state[1:self.PCs + 1]
+    NPCs = state[self.PCs + 1:]
+    if isDefeated(PCs):
+      for health, escape in PCs:
+        if escape == GONE: return FLEE
+      return LOSS
+    if isDefeated(NPCs): return WIN
+    return UNDECIDED
+
+  def getTransitions(self, state):
+    '''
+    Get a list of (chance, state) pairs for the states which can follow
+    this one, skipping the turns of characters who can't act.
+    Only states where the character whose turn it is can act are used.
+    '''
+    if state in self.transitions: return self.transitions[state]
+    if len(self.transitions) >= self.limit:
+      raise StateSpaceTooLarge("more than %d states" % self.limit)
+    column = self.order[state[0]]
+    chances = {}
+    for chance, characters in self.act(column, list(state[1:])):
+      following = self.getNextTurn(state[0], characters)
+      following = (following,) + tuple(characters)
+      chances[following] = chances.get(following, 0.0) + chance
+    results = [(chance, following) for following, chance in chances.items()]
+    self.transitions[state] = results
+    return results
+
+  def getNextTurn(self, turn, characters):
+    '''Skip the turns of characters who are incapacitated or gone.'''
+    for i in range(len(self.order)):
+      turn = (turn + 1) % len(self.order)
+      health, escape = characters[self.order[turn]]
+      if health != INCAPACITATED and escape != GONE: return turn
+    return turn
+
+  def act(self, column, characters):
+    '''
+    Get a list of (chance, characters) pairs for everything
+    that can happen on the turn of the character in this column.
+    '''
+    health, escape = characters[column]
+    traits = self.traits[column]
+    if escape == LEAVING:
+      return [(1.0, replace(characters, column, (health, GONE)))]
+    if health == INJURED:
+      if traits.healer:
+        return [(1.0, replace(characters, column, (HEALTHY, escape)))]
+      return [(1.0, replace(characters, column, (health, LEAVING)))]
+    NPC = column >= self.PCs
+    if traits.healer:
+      targets = []
+      for i in self.getParty(NPC):
+        health, escape = characters[i]
+        if health != HEALTHY and escape == STAYING: targets.append(i)
+      if len(targets) > 0:
+        results = []
+        for i in targets:
+          health, escape = characters[i]
+          healed = replace(characters, i, (health + 1, escape))
+          results.append((1.0 / len(targets), healed))
+        return results
+    targets = []
+    for i in self.getParty(not NPC):
+      health, escape = characters[i]
+      if health != INCAPACITATED and escape != GONE: targets.append(i)
+    if len(targets) == 0: return [(1.0, characters)]
+    results = []
+    for i in targets:
+      chance = 1.0 / len(targets)
+      hit = self.getHitChance(column, i, characters[i][1] == LEAVING)
+      health = characters[i][0]
+      if traits.fireball: health = INCAPACITATED
+      else:               health = health - 1
+      results.append((chance * hit, replace(characters, i, (health, STAYING))))
+      if hit < 1.0: results.append((chance * (1.0 - hit), characters))
+    return results
+
+  def getParty(self, NPC):
+    if NPC: return range(self.PCs, len(self.traits))
+    return range(self.PCs)
+
+  def getHitChance(self, attacker, defender, escaping):
+    attacker = self.traits[attacker]
+    defender = self.traits[defender]
+    return getHitChance(attacker.level, attacker.getAttackBonus(escaping),
+                        defender.level, defender.getDefenseBonus(escaping))
+
+  def explore(self):
+    '''Find every state which can be reached from the start of the fight.'''
+    start = self.getStart()
+    seen = {start: True}
+    states = [start]
+    for state in states:
+      if self.getOutcome(state) != UNDECIDED: continue
+      for chance, following in self.getTransitions(state):
+        if following not in seen:
+          seen[following] = True
+          states.append(following)
+    return states
+
+  def getStateCount(self):
+    '''The number of reachable states (the size of the state space).'''
+    if self.outcomes is None: self.solve()
+    return len(self.outcomes)
+
+  # SOLVING
+
+  def getComponents(self, states):
+    '''
+    Group the undecided states into strongly connected components
+    (states which can lead back to each other) with Tarjan's algorithm.
+    Components come out in reverse order: the ones that can only lead
+    to finished fights and to components already listed come first.
+    '''
+    index, lowlink, stacked = {}, {}, {}
+    stack, components = [], []
+    for root in states:
+      if root in index or root not in self.transitions: continue
+      work = [(root, 0)]
+      while work:
+        state, i = work.pop()
+        if i == 0:
+          index[state] = lowlink[state] = len(index)
+          stack.append(state)
+          stacked[state] = True
+        transitions = self.transitions[state]
+        while i < len(transitions):
+          following = transitions[i][1]
+          i = i + 1
+          if following not in self.transitions: continue
+          if following not in index: break
+          if following in stacked:
+            lowlink[state] = min(lowlink[state], index[following])
+        else:
+          if lowlink[state] == index[state]:
+            component = []
+            while True:
+              member = stack.pop()
+              del stacked[member]
+              component.append(member)
+              if member == state: break
+            components.append(component)
+          if work:
+            parent = work[-1][0]
+            lowlink[parent] = min(lowlink[parent], lowlink[state])
+          continue
+        work.append((state, i))
+        work.append((following, 0))
+    return components
+
+  def solve(self, tolerance = 1e-12, iterations = 100000):
+    '''
+    Find the chances of (WIN, FLEE, LOSS) from every reachable state.
+    Healing and missed attacks can return a fight to an earlier state,
+    so inside each group of states that lead back to each other the
+    chances are refined until they change less than tolerance.
+    '''
+    states = self.explore()
+    outcomes = {}
+    for state in states:
+      outcome = self.getOutcome(state)
+      if   outcome == WIN:  outcomes[state] = (1.0, 0.0, 0.0)
+      elif outcome == FLEE: outcomes[state] = (0.0, 1.0, 0.0)
+      elif outcome == LOSS: outcomes[state] = (0.0, 0.0, 1.0)
+      else:                 outcomes[state] = (0.0, 0.0, 0.0)
+    for component in self.getComponents(states):
+      change, iteration = tolerance, 0
+      while change >= tolerance and iteration < iterations:
+        change, iteration = 0.0, iteration + 1
+        for state in component:
+          win, flee, loss = 0.0, 0.0, 0.0
+          for chance, following in self.transitions[state]:
+            w, f, l = outcomes[following]
+            win = win + chance * w
+            flee = flee + chance * f
+            loss = loss + chance * l
+          old = outcomes[state]
+          change = max(change, abs(win - old[0]) + abs(flee - old[1]) +
+                               abs(loss - old[2]))
+          outcomes[state] = win, flee, loss
+    self.outcomes = outcomes
+    return outcomes
+
+  def getChances(self):
+    '''
+    Return a dictionary with the chances of WIN, FLEE and LOSS
+    at the start of the fight, and of a STALEMATE that never ends.
+    '''
+    if self.outcomes is None: self.solve()
+    win, flee, loss = self.outcomes[self.getStart()]
+    stalemate = max(0.0, 1.0 - win - flee - loss)
+    return {WIN: win, FLEE: flee, LOSS: loss, STALEMATE: stalemate}
+
+def isDefeated(characters):
+  '''True if these (health, escape) pairs are all incapacitated or gone'''
+  for health, escape in characters:
+    if not (health == INCAPACITATED or escape == GONE): return False
+  return True
+
+def replace(characters, column, condition):
+  '''Copy a list of (health, escape) pairs with one of them changed.'''
+  characters = list(characters)
+  characters[column] = condition
+  return characters
+
+# The chances for solved matchups are remembered, up to CACHE_SIZE of them.
+CACHE_SIZE = 256
+solved = {}
+
+def getMatchup(characters):
+  '''A key for the class and level of each character in a party.'''
+  return tuple([(c.__class__, c.getLevel()) for c in characters])
+
+def solve(PCs, NPCs, limit = 1000000):
+  '''
+  Return the chances of each outcome (see Solver.getChances)
+  and the number of states, remembering the answer for next time.
+  '''
+  key = getMatchup(PCs), getMatchup(NPCs)
+  if key not in solved:
+    if len(solved) >= CACHE_SIZE: solved.clear()
+    solver = Solver(PCs, NPCs, limit)
+    solved[key] = solver.getChances(), solver.getStateCount()
+  return solved[key]
@@ -0,0 +1,232 @@
+# Copyright 2008 Seth Galbraith
+#
+# This file is part of Minimam.
+#
+# Minimam is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Minimam is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Minimam.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Play every party composition against every other one on all CPU cores.
+
+A composition is a list of (class name, level) pairs, written on the
+command line as "Priest:1,Rogue:1,Warrior:1,Wizard:1". Every composition
+fights every composition (including itself) as the player characters
+and as the non-player characters. The fights for each matchup are split
+into work units which are shared out to a pool of worker processes, and
+the results are added up into a matrix of win rates as they come back.
+
+Run it from the src directory: python -m simulation.tournament --help
+'''
+
+import multiprocessing
+import optparse
+import sys
+import time
+
+from character.warrior import Warrior
+from character.rogue   import Rogue
+from character.wizard  import Wizard
+from character.priest  import Priest
+from character.monster import Monster
+from character.dragon  import Dragon
+from character.dice import Dice
+from combat.engine import Engine, WIN, FLEE, LOSS, STALEMATE
+
+CLASSES = {}
+for cls in Warrior, Rogue, Wizard, Priest, Monster, Dragon:
+  CLASSES[cls.__name__] = cls
+
+# the matchups from game.py
+COMPOSITIONS = [
+  [("Warrior", 0)] * 3,
+  [("Rogue", 0)] * 4,
+  [("Rogue", 0), ("Warrior", 0), ("Rogue", 0), ("Warrior", 0), ("Rogue", 0)],
+  [("Dragon", 0)] * 2,
+  [("Priest", 1), ("Rogue", 1), ("Warrior", 1), ("Wizard", 1)],
+  [("Monster", 0), ("Monster", 0), ("Dragon", 2), ("Monster", 0),
+   ("Monster", 0)]]
+
+def parseComposition(text):
+  '''Turn "Warrior:1,Rogue" into [("Warrior", 1), ("Rogue", 0)].'''
+  composition = []
+  for member in text.split(","):
+    parts = member.strip().split(":")
+    if parts[0] not in CLASSES:
+      raise ValueError("unknown character class: %s" % parts[0])
+    if len(parts) > 1: composition.append((parts[0], int(parts[1])))
+    else:              composition.append((parts[0], 0))
+  return composition
+
+def formatComposition(composition):
+  '''Turn [("Warrior", 1), ("Rogue", 0)] into "Warrior:1,Rogue".'''
+  members = []
+  for classname, level in composition:
+    if level: members.append("%s:%d" % (classname, level))
+    else:     members.append(classname)
+  return ",".join(members)
+
+def createParty(composition):
+  '''Make new Characters for a composition.'''
+  party = []
+  for classname, level in composition:
+    character = CLASSES[classname]()
+    character.setLevel(level)
+    party.append(character)
+  return party
+
+def play(unit):
+  '''
+  Play one work unit in a worker process. A unit is a tuple of
+  (PC composition index, NPC composition index, PC composition,
+  NPC composition, number of fights, seed, analytic).
+  Returns the two indexes and a dictionary of outcome counts.
+  '''
+  PC, NPC, PCs, NPCs, fights, seed, analytic = unit
+  counts = {WIN: 0, FLEE: 0, LOSS: 0, STALEMATE: 0}
+  engine = Engine(analytic = analytic, dice = Dice(seed))
+  for i in range(fights):
+    engine.setPlayerCharacters(createParty(PCs))
+    engine.setNonPlayerCharacters(createParty(NPCs))
+    outcome, turns = engine.resolve()
+    counts[outcome] = counts[outcome] + 1
+  return PC, NPC, counts
+
+class Tournament:
+
+  '''A round robin between party compositions played by a process pool.'''
+
+  def __init__(self, compositions = COMPOSITIONS, fights = 10000,
+               chunk = 1000, seed = None, analytic = False):
+    '''
+    fights is the number of fights for each matchup,
+    split into work units of at most chunk fights.
+    Raises ValueError unless both are at least 1.
+    '''
+    if fights < 1: raise ValueError("there must be at least 1 fight")
+    if chunk < 1: raise ValueError("the chunk must be at least 1 fight")
+    self.compositions = compositions
+    self.fights = fights
+    self.chunk = chunk
+    self.seed = seed
+    self.analytic = analytic
+    size = len(compositions)
+    self.counts = []
+    for i in range(size):
+      self.counts.append([])
+      for j in range(size):
+        self.counts[i].append({WIN: 0, FLEE: 0, LOSS: 0, STALEMATE: 0})
+
+  def getUnits(self):
+    '''Split all the fights into work units with their own seeds.'''
+    units = []
+    size = len(self.compositions)
+    for PC in range(size):
+      for NPC in range(size):
+        remaining = self.fights
+        while remaining > 0:
+          fights = min(self.chunk, remaining)
+          remaining = remaining - fights
+          units.append([PC, NPC, self.compositions[PC],
+                        self.compositions[NPC], fights])
+    dice = Dice(self.seed).spawn(len(units))
+    for i in range(len(units)):
+      units[i] = tuple(units[i] + [dice[i].seed, self.analytic])
+    return units
+
+  def merge(self, PC, NPC, counts):
+    '''Add the outcome counts from one work unit to the totals.'''
+    totals = self.counts[PC][NPC]
+    for outcome, count in counts.items():
+      totals[outcome] = totals[outcome] + count
+
+  def run(self, processes = None, progress = None):
+    '''
+    Play all the fights with a pool of processes (one per CPU by default).
+    progress is called with the number of units done and the total.
+    '''
+    units = self.getUnits()
+    pool = multiprocessing.Pool(processes)
+    try:
+      done = 0
+      for PC, NPC, counts in pool.imap_unordered(play, units):
+        self.merge(PC, NPC, counts)
+        done = done + 1
+        if progress is not None: progress(done, len(units))
+    finally:
+      pool.close()
+      pool.join()
+
+  def getRate(self, PC, NPC, outcome = WIN):
+    counts = self.counts[PC][NPC]
+    total = sum(counts.values())
+    if total == 0: return 0.0
+    return counts[outcome] / float(total)
+
+  def getMatrix(self, outcome = WIN):
+    '''Rates of an outcome, one row per PC and one column per NPC party.'''
+    size = len(self.compositions)
+    return [[self.getRate(PC, NPC, outcome) for NPC in range(size)]
+            for PC in range(size)]
+
+  def report(self, stream = sys.stdout):
+    '''Write the win rate matrix as a table.'''
+    names = [formatComposition(c) for c in self.compositions]
+    stream.write("win rate of the PCs (rows) against the NPCs (columns)\n")
+    for i in range(len(names)):
+      stream.write("%3d  %s\n" % (i, names[i]))
+    stream.write("     " + "".join(["%7d" % i for i in range(len(names))]))
+    stream.write("\n")
+    matrix = self.getMatrix()
+    for i in range(len(names)):
+      stream.write("%3d  " % i)
+      stream.write("".join(["%7.3f" % rate for rate in matrix[i]]) + "\n")
+
+def main(arguments = None):
+  parser = optparse.OptionParser(
+    usage = "%prog [options] [composition ...]",
+    description = "Play a round robin between party compositions such as "
+                  "Priest:1,Rogue:1,Warrior:1,Wizard:1 (class:level, "
+                  "level 0 if left out). Without any compositions the "
+                  "parties from game.py are used.")
+  parser.add_option("-n", "--fights", type = "int", default = 10000,
+                    help = "fights per matchup [%default]")
+  parser.add_option("-c", "--chunk", type = "int", default = 1000,
+                    help = "fights per work unit [%default]")
+  parser.add_option("-p", "--processes", type = "int", default = None,
+                    help = "worker processes [one per CPU]")
+  parser.add_option("-s", "--seed", type = "int", default = None,
+                    help = "seed for repeatable results")
+  parser.add_option("-a", "--analytic", action = "store_true",
+                    help = "decide attacks with the odds tables")
+  options, arguments = parser.parse_args(arguments)
+  if arguments:
+    try:
+      compositions = [parseComposition(text) for text in arguments]
+    except ValueError as error:
+      parser.error(str(error))
+  else:
+    compositions = COMPOSITIONS
+  try:
+    tournament = Tournament(compositions, options.fights, options.chunk,
+                            options.seed, options.analytic)
+  except ValueError as error:
+    parser.error(str(error))
+  start = time.time()
+  def progress(done, total):
+    sys.stderr.write("\r%d/%d work units" % (done, total))
+  tournament.run(options.processes, progress)
+  sys.stderr.write(" in %.1f seconds\n" % (time.time() - start))
+  tournament.report()
+
+if __name__ == "__main__":
+  main()